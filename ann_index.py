@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import numpy as np
+from embedding_store import quantize, dot, save_array, load_array, CHUNK_SIZE
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_desc(scores, k):
+    if k >= len(scores):
+        return np.argsort(scores)[::-1]
+    part = np.argpartition(scores, -k)[-k:]
+    return part[np.argsort(scores[part])[::-1]]
+
+
+class IVFIndex:
+    """Инвертированный индекс по центроидам KMeans с мульти-пробным поиском
+
+    Каждый список хранит нормированные векторы своего кластера подряд,
+    поэтому поиск по кластеру — это одно умножение матрицы на вектор.
+    nprobe задаёт число ближайших кластеров, которые просматриваются:
+    больше nprobe — выше полнота, но дольше поиск.
+    Векторы могут храниться в float16 или int8 (dtype), а сохранённый
+    индекс открывается через np.memmap и разделяется между процессами.
+    """
+
+    def __init__(self, centroids, nprobe=1, dtype='float32', scale=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.scale = scale
+        n_lists, dim = self.centroids.shape
+        self.list_ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self.list_vectors = [np.empty((0, dim), dtype=dtype) for _ in range(n_lists)]
+
+    @classmethod
+    def build(cls, embeddings, centroids, assignments, nprobe=1, dtype='float32'):
+        index = cls(centroids, nprobe=nprobe, dtype=dtype)
+        if dtype == 'int8':
+            index.scale = quantize(normalize(embeddings), dtype)[1]
+        index.add(embeddings, assignments, np.arange(len(embeddings)))
+        return index
+
+    @classmethod
+    def build_on_disk(cls, embeddings, centroids, assignments, directory, nprobe=1, dtype='float32',
+                      chunk_size=CHUNK_SIZE):
+        """Строит индекс сразу в файлах за проход по эмбеддингам порциями и открывает его через memmap
+
+        Раскладка та же, что у build + save, но в памяти одновременно
+        находится только одна нормированная порция.
+        """
+        assignments = np.asarray(assignments)
+        n_rows, dim = len(embeddings), np.asarray(centroids).shape[1]
+        index = cls(centroids, nprobe=nprobe, dtype=dtype)
+        if dtype == 'int8':
+            peak = np.zeros(dim, dtype=np.float32)
+            for start in range(0, n_rows, chunk_size):
+                peak = np.maximum(peak, np.abs(normalize(embeddings[start:start + chunk_size])).max(axis=0))
+            index.scale = np.where(peak == 0, 1.0, peak / 127.0).astype(np.float32)
+
+        counts = np.bincount(assignments, minlength=index.n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        os.makedirs(directory, exist_ok=True)
+        ids_path = os.path.join(directory, 'ids.npy')
+        vectors_path = os.path.join(directory, 'vectors.npy')
+        ids = np.lib.format.open_memmap(ids_path + '.tmp', mode='w+', dtype=np.int64, shape=(n_rows,))
+        vectors = np.lib.format.open_memmap(vectors_path + '.tmp', mode='w+', dtype=np.dtype(dtype), shape=(n_rows, dim))
+        cursor = offsets[:-1].copy()
+        for start in range(0, n_rows, chunk_size):
+            codes, _ = quantize(normalize(embeddings[start:start + chunk_size]), dtype, index.scale)
+            lists = assignments[start:start + chunk_size]
+            order = np.argsort(lists, kind='stable')
+            chunk_counts = np.bincount(lists, minlength=index.n_lists)
+            rank = np.arange(len(order)) - (np.cumsum(chunk_counts) - chunk_counts)[lists[order]]
+            targets = cursor[lists[order]] + rank
+            ids[targets] = start + order
+            vectors[targets] = codes[order]
+            cursor += chunk_counts
+        ids.flush()
+        vectors.flush()
+        del ids, vectors
+        os.replace(ids_path + '.tmp', ids_path)
+        os.replace(vectors_path + '.tmp', vectors_path)
+        index._save_header(directory, offsets)
+        return cls.load(directory)
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.list_ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def add(self, embeddings, assignments, ids):
+        vectors, _ = quantize(normalize(embeddings), self.dtype, self.scale)
+        assignments = np.asarray(assignments)
+        ids = np.asarray(ids, dtype=np.int64)
+        for list_id in np.unique(assignments):
+            mask = assignments == list_id
+            self.list_ids[list_id] = np.concatenate([self.list_ids[list_id], ids[mask]])
+            self.list_vectors[list_id] = np.vstack([self.list_vectors[list_id], vectors[mask]])
+
+    def remove(self, ids, compact=True):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        for list_id in range(self.n_lists):
+            keep = ~np.isin(self.list_ids[list_id], ids)
+            if not keep.all():
+                self.list_ids[list_id] = self.list_ids[list_id][keep]
+                self.list_vectors[list_id] = self.list_vectors[list_id][keep]
+            if compact and len(ids):
+                self.list_ids[list_id] = self.list_ids[list_id] - np.searchsorted(ids, self.list_ids[list_id])
+
+    def probe_order(self, query):
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        dists = ((self.centroids - query) ** 2).sum(axis=1)
+        return np.argsort(dists)
+
+    def search(self, query, top_k=20, nprobe=None):
+        nprobe = self.nprobe if nprobe is None else nprobe
+        unit_query = normalize(np.asarray(query).reshape(-1))
+
+        ids, scores = [], []
+        for list_id in self.probe_order(query)[:nprobe]:
+            if len(self.list_ids[list_id]) == 0:
+                continue
+            ids.append(self.list_ids[list_id])
+            scores.append(dot(self.list_vectors[list_id], unit_query, self.scale))
+
+        if not ids:
+            for list_id in range(self.n_lists):
+                ids.append(self.list_ids[list_id])
+                scores.append(dot(self.list_vectors[list_id], unit_query, self.scale))
+
+        ids = np.concatenate(ids)
+        scores = np.concatenate(scores)
+        order = top_k_desc(scores, top_k)
+        return ids[order], scores[order]
+
+    def search_batch(self, queries, top_k=20, nprobe=None):
+        nprobe = self.nprobe if nprobe is None else nprobe
+        queries = np.asarray(queries, dtype=np.float32)
+        unit_queries = normalize(queries)
+
+        dists = (
+            (queries ** 2).sum(axis=1)[:, None]
+            - 2 * queries @ self.centroids.T
+            + (self.centroids ** 2).sum(axis=1)[None, :]
+        )
+        probes = np.argsort(dists, axis=1)[:, :nprobe]
+
+        cand_ids = [[] for _ in range(len(queries))]
+        cand_scores = [[] for _ in range(len(queries))]
+        for list_id in range(self.n_lists):
+            list_size = len(self.list_ids[list_id])
+            query_rows = np.nonzero((probes == list_id).any(axis=1))[0]
+            if list_size == 0 or len(query_rows) == 0:
+                continue
+            scores = dot(self.list_vectors[list_id], unit_queries[query_rows], self.scale).T
+            if top_k < list_size:
+                best = np.argpartition(scores, -top_k, axis=1)[:, -top_k:]
+            else:
+                best = np.broadcast_to(np.arange(list_size), (len(query_rows), list_size))
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            for row, query_row in enumerate(query_rows):
+                cand_ids[query_row].append(self.list_ids[list_id][best[row]])
+                cand_scores[query_row].append(best_scores[row])
+
+        results = []
+        for query_row in range(len(queries)):
+            if not cand_ids[query_row]:
+                results.append(self.search(queries[query_row], top_k=top_k, nprobe=self.n_lists))
+                continue
+            ids = np.concatenate(cand_ids[query_row])
+            scores = np.concatenate(cand_scores[query_row])
+            order = top_k_desc(scores, top_k)
+            results.append((ids[order], scores[order]))
+        return results
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        offsets = np.cumsum([0] + [len(ids) for ids in self.list_ids])
+        save_array(os.path.join(directory, 'ids.npy'), np.concatenate(self.list_ids))
+        save_array(os.path.join(directory, 'vectors.npy'), np.concatenate(self.list_vectors))
+        self._save_header(directory, offsets)
+
+    def _save_header(self, directory, offsets):
+        save_array(os.path.join(directory, 'centroids.npy'), self.centroids)
+        save_array(os.path.join(directory, 'offsets.npy'), offsets)
+        if self.scale is not None:
+            save_array(os.path.join(directory, 'scale.npy'), self.scale)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'nprobe': self.nprobe, 'dtype': self.dtype}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        scale = None
+        if meta['dtype'] == 'int8':
+            scale = load_array(os.path.join(directory, 'scale.npy'), mmap_mode=None)
+        index = cls(load_array(os.path.join(directory, 'centroids.npy'), mmap_mode=None),
+                    nprobe=meta['nprobe'], dtype=meta['dtype'], scale=scale)
+        offsets = load_array(os.path.join(directory, 'offsets.npy'), mmap_mode=None)
+        ids = load_array(os.path.join(directory, 'ids.npy'), mmap_mode=mmap_mode)
+        vectors = load_array(os.path.join(directory, 'vectors.npy'), mmap_mode=mmap_mode)
+        for list_id in range(index.n_lists):
+            start, stop = offsets[list_id], offsets[list_id + 1]
+            index.list_ids[list_id] = ids[start:stop]
+            index.list_vectors[list_id] = vectors[start:stop]
+        return index
+
+
+def exact_search(embeddings, query, top_k=20):
+    scores = normalize(embeddings) @ normalize(np.asarray(query).reshape(-1))
+    order = top_k_desc(scores, top_k)
+    return order, scores[order]
+
+
+def recall_report(index, embeddings, k=20, nprobes=(1, 2, 3), n_queries=200, random_state=42):
+    """Сравнивает полноту recall@k и задержку IVF-поиска с точным перебором"""
+    rng = np.random.default_rng(random_state)
+    n_queries = min(n_queries, len(embeddings))
+    queries = embeddings[rng.choice(len(embeddings), size=n_queries, replace=False)]
+    unit_corpus = normalize(embeddings)
+
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = unit_corpus @ normalize(query)
+        exact.append(set(top_k_desc(scores, k).tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    report = [{'nprobe': 'exact', 'recall': 1.0, 'latency_ms': exact_ms}]
+    for nprobe in nprobes:
+        hits = 0
+        start = time.perf_counter()
+        found = [index.search(query, top_k=k, nprobe=nprobe)[0] for query in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / n_queries
+        for ids, truth in zip(found, exact):
+            hits += len(truth.intersection(ids.tolist()))
+        report.append({
+            'nprobe': nprobe,
+            'recall': hits / sum(len(truth) for truth in exact),
+            'latency_ms': latency_ms
+        })
+    return report
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -5,7 +6,27 @@ import plotly.express as px
 import plotly.graph_objects as go
 from collections import defaultdict
 import time
-from bert_processor import bert_processor, initialize_processor, predict_user_cluster
+from bert_processor import bert_processor
+from snapshots import SnapshotManager
+from warmup import BackgroundLoader
+
+PAGE_START = time.perf_counter()
+SOURCE_PATH = 'base_doc.xlsx'
+
+LOADING_STAGES = {
+    'idle': 'Подготовка...',
+    'loading': 'Подготовка...',
+    'reading': '📄 Читаем базу анкет',
+    'preprocessing': '✂️ Обрабатываем тексты анкет',
+    'encoding': '🧠 Строим эмбеддинги',
+    'clustering': '🎯 Выделяем группы интересов',
+    'indexing': '🔍 Строим поисковый индекс',
+    'saving': '💾 Сохраняем результаты',
+    'loading_data': '📦 Загружаем обработанные данные',
+    'loading_tools': '📚 Загружаем словари',
+    'loading_model': '🤖 Загружаем AI модель',
+    'loading_index': '🔍 Загружаем поисковый индекс'
+}
 
 st.set_page_config(
     page_title="FriendFinder - AI Powered Friend Matching",
@@ -235,12 +256,27 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def warm_up(manager):
+    """Подключает текущую версию данных или собирает первую (выполняется в фоновом потоке)"""
+    manager.start(SOURCE_PATH)
+    metrics_port = os.environ.get('FRIENDFINDER_METRICS_PORT')
+    if manager.metrics.enabled and metrics_port:
+        manager.metrics.serve(int(metrics_port))
+    return manager
+
 @st.cache_resource
 def load_processor():
-    """Загружает BERT модель и обрабатывает данные профилей"""
-    with st.spinner('🔄 Загружаем AI модель и обрабатываем данные... Это может занять несколько минут...'):
-        df, embeddings = initialize_processor()
-        return df, embeddings, bert_processor
+    """Запускает фоновую загрузку, чтобы интерфейс отрисовывался сразу"""
+    manager = SnapshotManager(encoder=bert_processor.encoder, metrics=bert_processor.metrics)
+    loader = BackgroundLoader(lambda: warm_up(manager), status_fn=lambda: manager.status)
+    return loader.start()
+
+def search_profiles(manager, user_profile):
+    """Определяет группу интересов пользователя и подбирает похожие анкеты на текущей версии данных"""
+    processor = manager.processor
+    user_cluster = processor.predict_cluster_for_text(user_profile)
+    reranker = processor.feedback_session(user_profile, collapse=True)
+    return user_cluster, reranker
 
 def initialize_session_state():
     """Инициализирует состояние приложения при первом запуске"""
@@ -251,7 +287,9 @@ def initialize_session_state():
         'user_profile': "",
         'search_performed': False,
         'processor_loaded': False,
-        'user_cluster': None
+        'user_cluster': None,
+        'reranker': None,
+        'time_to_first_paint': None
     }
     
     for key, value in defaults.items():
@@ -350,19 +388,97 @@ def display_sidebar_stats(processor):
             st.markdown(f"<div style='color: white; margin: 6px 0;'>• {tip}</div>", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
-def display_search_results(processor, user_profile):
-    """Ищет похожие профили используя AI модель"""
-    with st.spinner('🔍 AI анализирует ваши интересы и ищет единомышленников...'):
-        user_cluster = predict_user_cluster(user_profile)
+def display_search_results(loader, user_profile):
+    """Ищет похожие профили используя AI модель (до окончания загрузки запрос ждёт в очереди)"""
+    if loader.ready:
+        spinner_text = '🔍 AI анализирует ваши интересы и ищет единомышленников...'
+    else:
+        spinner_text = '⏳ AI модель ещё загружается — ваш запрос в очереди и выполнится автоматически...'
+    
+    with st.spinner(spinner_text):
+        user_cluster, reranker = loader.submit(lambda: search_profiles(loader.result, user_profile)).result()
         st.session_state.user_cluster = user_cluster
-        
-        recommendations = processor.find_similar_profiles(user_profile)
-        st.session_state.recommendations = recommendations
+        st.session_state.reranker = reranker
+        st.session_state.recommendations = reranker.recommendations() if reranker is not None else pd.DataFrame()
         st.session_state.current_profile_index = 0
         st.session_state.search_performed = True
     
+    processor = reranker.processor if reranker is not None else bert_processor
+    metrics_file = os.environ.get('FRIENDFINDER_METRICS_FILE')
+    if processor.metrics.enabled and metrics_file:
+        processor.metrics.write_prometheus(metrics_file)
+    
     return True
 
+def display_loading_status(loader):
+    """Показывает в боковой панели ход фоновой загрузки модели"""
+    with st.sidebar:
+        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+        st.markdown("### ⏳ Загрузка AI модели")
+        st.markdown(f"<div style='color: white;'>{LOADING_STAGES.get(loader.status, loader.status)}</div>", unsafe_allow_html=True)
+        if loader.queued:
+            st.markdown(f"<div style='color: white;'>Запросов в очереди: {loader.queued}</div>", unsafe_allow_html=True)
+        st.markdown("<div style='color: white; opacity: 0.8;'>Можно уже заполнять анкету — поиск запустится сразу после загрузки.</div>", unsafe_allow_html=True)
+        st.button("🔄 Обновить статус", key="refresh_status_btn", use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def display_data_version(manager):
+    """Показывает версию данных и фоновое обновление базы, не блокируя поиск"""
+    manager.sync(SOURCE_PATH)
+    task = manager.task
+    with st.sidebar:
+        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+        st.markdown(f"<div style='color: white;'>🗂️ Версия данных: {manager.version}</div>", unsafe_allow_html=True)
+        if manager.busy:
+            builder = manager.builder
+            stage = LOADING_STAGES.get(builder.status, builder.status) if builder else LOADING_STAGES['loading_data']
+            st.markdown(f"<div style='color: white; opacity: 0.8;'>Обновляем базу в фоне: {stage}</div>", unsafe_allow_html=True)
+        elif task is not None and task.exception() is not None:
+            st.markdown(f"<div style='color: white; opacity: 0.8;'>Обновить базу не удалось: {task.exception()}</div>", unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def record_first_paint(processor):
+    """Запоминает время до первой отрисовки интерфейса в текущей сессии"""
+    if st.session_state.time_to_first_paint is None:
+        st.session_state.time_to_first_paint = time.perf_counter() - PAGE_START
+        if processor.metrics.enabled:
+            processor.metrics.observe('time_to_first_paint', st.session_state.time_to_first_paint)
+
+def display_performance_panel(processor, loader):
+    """Показывает замеры производительности в боковой панели (если включены метрики)"""
+    if not processor.metrics.enabled:
+        return
+    
+    with st.sidebar:
+        st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+        if st.checkbox("⚙️ Производительность", value=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("⚡ Первая отрисовка", f"{st.session_state.time_to_first_paint or 0:.2f} с")
+            with col2:
+                st.metric("✅ Готовность", f"{loader.time_to_ready or 0:.1f} с")
+            
+            snapshot = processor.metrics.snapshot()
+            rows = [
+                {
+                    'Этап': stage,
+                    'Вызовов': values['count'],
+                    'p50, мс': round(values['p50_ms'], 2),
+                    'p95, мс': round(values['p95_ms'], 2),
+                    'Среднее, мс': round(values['mean_ms'], 2)
+                }
+                for stage, values in sorted(snapshot['stages'].items())
+            ]
+            if rows:
+                st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            else:
+                st.write("Замеров пока нет")
+            
+            for name, value in sorted(snapshot['gauges'].items()):
+                if name.endswith('_hit_rate'):
+                    st.markdown(f"<div style='color: white;'>• {name}: {value * 100:.1f}%</div>", unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
 def display_current_profile(recommendations, current_index):
     """Показывает текущий профиль из рекомендаций"""
     if current_index >= len(recommendations):
@@ -453,6 +569,15 @@ def display_current_profile(recommendations, current_index):
     
     return True
 
+def apply_feedback(liked):
+    """Запоминает оценку и переранжирует оставшиеся анкеты без нового поиска"""
+    current_profile = st.session_state.recommendations.iloc[st.session_state.current_profile_index]
+    if liked is not None:
+        st.session_state.user_feedback['liked' if liked else 'disliked'].append(current_profile['index'])
+    if st.session_state.reranker is not None:
+        st.session_state.recommendations = st.session_state.reranker.feedback(current_profile['index'], liked)
+    st.session_state.current_profile_index += 1
+
 def display_feedback_buttons():
     """Показывает кнопки для оценки профилей"""
     st.markdown("---")
@@ -462,21 +587,17 @@ def display_feedback_buttons():
     
     with feedback_col1:
         if st.button("👍 ИНТЕРЕСЕН", key="like_btn", use_container_width=True):
-            current_profile = st.session_state.recommendations.iloc[st.session_state.current_profile_index]
-            st.session_state.user_feedback['liked'].append(current_profile['index'])
-            st.session_state.current_profile_index += 1
+            apply_feedback(True)
             st.rerun()
     
     with feedback_col2:
         if st.button("👎 НЕ ИНТЕРЕСЕН", key="dislike_btn", use_container_width=True):
-            current_profile = st.session_state.recommendations.iloc[st.session_state.current_profile_index]
-            st.session_state.user_feedback['disliked'].append(current_profile['index'])
-            st.session_state.current_profile_index += 1
+            apply_feedback(False)
             st.rerun()
     
     with feedback_col3:
         if st.button("⏭️ СЛЕДУЮЩИЙ", key="skip_btn", use_container_width=True):
-            st.session_state.current_profile_index += 1
+            apply_feedback(None)
             st.rerun()
 
 def display_search_stats(recommendations):
@@ -542,6 +663,7 @@ def display_final_results(recommendations, processor):
     if st.button("🌱 НАЧАТЬ НОВЫЙ ПОИСК", key="new_search_btn", use_container_width=True):
         st.session_state.current_profile_index = 0
         st.session_state.recommendations = None
+        st.session_state.reranker = None
         st.session_state.search_performed = False
         st.session_state.user_feedback = defaultdict(list)
         st.session_state.user_cluster = None
@@ -552,7 +674,7 @@ def display_final_results(recommendations, processor):
         
         for profile_idx in st.session_state.user_feedback['liked']:
             try:
-                profile = processor.df.iloc[profile_idx]
+                profile = processor.df.loc[profile_idx]
                 description_text = profile["Описание"]
                 if len(description_text) > 120:
                     title = description_text[:120] + "..."
@@ -572,22 +694,35 @@ def main():
     initialize_session_state()
     display_welcome_section()
     
-    try:
-        df, embeddings, processor = load_processor()
-        st.session_state.processor_loaded = True
-    except Exception as e:
-        st.error(f"❌ Ошибка загрузки процессора: {str(e)}")
+    loader = load_processor()
+    if loader.state == 'failed':
+        load_processor.clear()
+        st.error(f"❌ Ошибка загрузки процессора: {str(loader.error)}")
         st.info("⚠️ Пожалуйста, убедитесь что файл base_doc.xlsx находится в корневой панели")
+        st.button("🔄 Повторить загрузку", key="retry_load_btn", use_container_width=True)
         return
     
-    display_sidebar_stats(processor)
+    if loader.ready:
+        manager = loader.result
+        st.session_state.processor_loaded = True
+        display_sidebar_stats(manager.processor)
+        display_data_version(manager)
+        display_performance_panel(manager.processor, loader)
+    else:
+        display_loading_status(loader)
     
     user_profile = display_profile_input_section()
+    record_first_paint(bert_processor)
     
     if st.button("🌱 Найти единомышленников", use_container_width=True):
         if user_profile.strip():
             st.session_state.user_profile = user_profile
-            if display_search_results(processor, user_profile):
+            try:
+                searched = display_search_results(loader, user_profile)
+            except Exception as e:
+                st.error(f"❌ Ошибка загрузки процессора: {str(e)}")
+                return
+            if searched:
                 st.rerun()
         else:
             st.error("❌ Пожалуйста, заполните информацию о ваших интересах!")
@@ -605,7 +740,7 @@ def main():
             if display_current_profile(recommendations, st.session_state.current_profile_index):
                 display_feedback_buttons()
         else:
-            display_final_results(recommendations, processor)
+            display_final_results(recommendations, st.session_state.reranker.processor)
     
     elif st.session_state.search_performed:
         st.info("🔍 По вашему запросу не найдено подходящих людей. Попробуйте изменить описание ваших интересов.")
@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+
+from bert_processor import BERTProcessor
+from encoders import make_encoder, BACKENDS
+from normalization import STOP_WORDS, CUSTOM_STOP_WORDS, NLTK_RUSSIAN_STOP_WORDS, normalize, tokenize
+
+NAMES = ['Алексей', 'Мария', 'Иван', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Екатерина', 'Никита', 'Татьяна']
+ACTIVITIES = [
+    'пишу код на питоне', 'играю в футбол по выходным', 'готовлю итальянскую пасту', 'хожу в походы по горам',
+    'рисую акварелью пейзажи', 'собираю старинные монеты', 'выращиваю розы на даче', 'читаю фантастику',
+    'играю на гитаре', 'танцую сальсу', 'изучаю японский язык', 'фотографирую природу', 'катаюсь на велосипеде',
+    'пою в церковном хоре', 'наблюдаю за звёздами в телескоп', 'играю в настольные игры', 'езжу на рыбалку',
+    'вяжу свитера', 'путешествую по морю', 'изучаю историю древнего рима', 'собираю модели кораблей',
+    'занимаюсь йогой', 'играю в шахматы', 'пеку домашний хлеб', 'слушаю джаз', 'хожу в театр'
+]
+GOALS = [
+    'Ищу друзей для совместных прогулок.', 'Хочу найти единомышленников.', 'Буду рад новым знакомствам.',
+    'Ищу компанию для путешествий.', 'Хочу общаться с интересными людьми.'
+]
+
+
+def generate_corpus(n_rows, seed=42):
+    """Генерирует синтетические анкеты на русском языке"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n_rows):
+        activities = rng.choice(ACTIVITIES, size=rng.integers(2, 5), replace=False)
+        rows.append(
+            f'Привет! Меня зовут {rng.choice(NAMES)}, мне {rng.integers(18, 70)} лет. '
+            f'{" и ".join(activities).capitalize()}. {rng.choice(GOALS)}'
+        )
+    return pd.DataFrame({'Описание': rows})
+
+
+def replicate_corpus(path, n_rows):
+    df = pd.read_excel(path).dropna(subset=['Описание'])
+    repeats = int(np.ceil(n_rows / len(df)))
+    return pd.concat([df] * repeats, ignore_index=True).iloc[:n_rows]
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def timed(stages, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stages[name] = {'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+    return result
+
+
+def latency_stats(fn, queries):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - start
+    return {
+        'queries': len(queries),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'qps': len(queries) / total if total else 0.0
+    }
+
+
+def legacy_tokenizer():
+    """Прежняя токенизация: два re.sub на каждый вызов и nltk word_tokenize (если доступен punkt)"""
+    try:
+        from nltk.tokenize import word_tokenize
+        word_tokenize('проверка токенизатора', language='russian')
+        name = 'nltk.word_tokenize'
+    except (ImportError, LookupError):
+        word_tokenize, name = (lambda text, language=None: text.split()), 'str.split'
+
+    def legacy_tokenize(text):
+        text = text.lower()
+        text = re.sub(r'[^а-яё\s]', ' ', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        return word_tokenize(text, language='russian')
+    return legacy_tokenize, name
+
+
+def legacy_stop_words():
+    try:
+        from nltk.corpus import stopwords
+        return set(stopwords.words('russian')).union(CUSTOM_STOP_WORDS)
+    except (ImportError, LookupError):
+        return None
+
+
+def legacy_normalize(text, tokenize_fn, stop_words, lemmatize):
+    if not isinstance(text, str) or not text.strip():
+        return ''
+    cleaned = []
+    for token in tokenize_fn(text):
+        if token not in stop_words and len(token) > 2:
+            lemma = lemmatize(token)
+            if lemma not in stop_words and len(lemma) > 2:
+                cleaned.append(lemma)
+    return ' '.join(cleaned)
+
+
+def throughput(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    seconds = time.perf_counter() - start
+    return len(texts) * repeat / seconds if seconds else 0.0
+
+
+def run_normalization_benchmark(texts, repeat=3):
+    """Проверяет, что новая нормализация совпадает с прежней, и сравнивает скорость
+
+    Лемматизация в обоих вариантах тождественная: pymorphy2 не менялся,
+    поэтому сравниваются токенизация, фильтр стоп-слов и длины. Без данных
+    punkt эталоном был бы str.split, а не word_tokenize, поэтому совпадение
+    не засчитывается: verified = False, счётчики расхождений — None.
+    """
+    texts = [text for text in texts if isinstance(text, str)]
+    legacy_tokenize, reference = legacy_tokenizer()
+    reference_stop_words = legacy_stop_words()
+    stop_words = STOP_WORDS if reference_stop_words is None else reference_stop_words
+    identity = lambda token: token
+
+    token_mismatches = sum(1 for text in texts if legacy_tokenize(text) != tokenize(text))
+    output_mismatches = sum(
+        1 for text in texts
+        if legacy_normalize(text, legacy_tokenize, stop_words, identity) != normalize(text, identity)
+    )
+    legacy_tps = throughput(lambda text: legacy_normalize(text, legacy_tokenize, stop_words, identity), texts, repeat)
+    new_tps = throughput(lambda text: normalize(text, identity), texts, repeat)
+    verified = reference == 'nltk.word_tokenize'
+    return {
+        'texts': len(texts),
+        'reference_tokenizer': reference,
+        'verified': verified,
+        'stop_words_match_nltk': None if reference_stop_words is None else reference_stop_words == STOP_WORDS,
+        'nltk_stop_words_bundled': len(NLTK_RUSSIAN_STOP_WORDS),
+        'token_mismatches': token_mismatches if verified else None,
+        'output_mismatches': output_mismatches if verified else None,
+        'legacy_texts_per_second': legacy_tps,
+        'new_texts_per_second': new_tps,
+        'speedup': new_tps / legacy_tps if legacy_tps else 0.0
+    }
+
+
+def run_benchmark(n_rows, encoder='hashing', n_queries=200, n_clusters=6, n_workers=1, source=None,
+                  source_format='csv', warm_start=True, seed=42, clustering_method='auto'):
+    """Замеряет этапы load_and_process_data и задержку запросов на корпусе из n_rows анкет"""
+    workdir = tempfile.mkdtemp(prefix='friendfinder_bench_')
+    try:
+        corpus = replicate_corpus(source, n_rows) if source else generate_corpus(n_rows, seed)
+        source_path = os.path.join(workdir, f'profiles.{source_format}')
+        if source_format == 'xlsx':
+            corpus.to_excel(source_path, index=False)
+        elif source_format == 'parquet':
+            corpus.to_parquet(source_path, index=False)
+        else:
+            corpus.to_csv(source_path, index=False)
+
+        data_dir = os.path.join(workdir, 'processed_data')
+        processor = BERTProcessor(data_dir=data_dir, encoder=make_encoder(encoder), n_workers=n_workers,
+                                  auto_refit=False, clustering_method=clustering_method)
+
+        stages = {}
+        timed(stages, 'read', processor.read_data, source_path)
+        timed(stages, 'preprocess', processor.preprocess_data)
+        timed(stages, 'encode', processor.create_bert_embeddings)
+        timed(stages, 'kmeans', processor.perform_clustering, n_clusters, with_pca=False)
+        timed(stages, 'pca', processor.compute_pca)
+        timed(stages, 'index', processor.build_index)
+        timed(stages, 'save', processor.save_processed_data, source_path)
+
+        queries = generate_corpus(n_queries, seed + 1)['Описание'].tolist()
+        processor.query_cache.clear()
+        queries_stats = {'find_similar_profiles': latency_stats(processor.find_similar_profiles, queries)}
+        processor.query_cache.clear()
+        queries_stats['find_similar_profiles_exact'] = latency_stats(
+            lambda query: processor.find_similar_profiles(query, mode='exact'), queries
+        )
+        processor.query_cache.clear()
+        queries_stats['find_similar_profiles_hybrid'] = latency_stats(
+            lambda query: processor.find_similar_profiles(query, mode='hybrid'), queries
+        )
+        processor.query_cache.clear()
+        queries_stats['predict_cluster_for_text'] = latency_stats(processor.predict_cluster_for_text, queries)
+
+        result = {
+            'rows': len(processor.df),
+            'encoder': encoder,
+            'clustering_method': clustering_method,
+            'source_format': source_format,
+            'stages': stages,
+            'total_seconds': sum(stage['seconds'] for stage in stages.values()),
+            'queries': queries_stats
+        }
+
+        if warm_start:
+            warm = BERTProcessor(data_dir=data_dir, encoder=make_encoder(encoder), auto_refit=False,
+                                 clustering_method=clustering_method)
+            warm_stages = {}
+            timed(warm_stages, 'warm_start', warm.load_and_process_data, source_path, n_clusters)
+            result['warm_start'] = warm_stages['warm_start']
+
+        result['peak_rss_mb'] = peak_rss_mb()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк этапов обработки и поиска FriendFinder')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--encoder', choices=BACKENDS, default='hashing')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clusters', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--clustering', choices=['auto', 'full', 'minibatch'], default='auto')
+    parser.add_argument('--source', help='Размножить анкеты из этого файла вместо синтетических')
+    parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], default='csv')
+    parser.add_argument('--no-warm-start', action='store_true')
+    parser.add_argument('--output', help='Файл для результатов JSON (по умолчанию stdout)')
+    parser.add_argument('--normalization', action='store_true',
+                        help='Только проверка и замер нормализации текста (без модели)')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': []
+    }
+    if args.normalization:
+        for n_rows in args.rows:
+            corpus = replicate_corpus(args.source, n_rows) if args.source else generate_corpus(n_rows)
+            results['runs'].append(run_normalization_benchmark(corpus['Описание'].tolist()))
+    for n_rows in ([] if args.normalization else args.rows):
+        results['runs'].append(run_benchmark(
+            n_rows, encoder=args.encoder, n_queries=args.queries, n_clusters=args.clusters,
+            n_workers=args.workers, source=args.source, source_format=args.format,
+            warm_start=not args.no_warm_start, clustering_method=args.clustering
+        ))
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
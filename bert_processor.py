@@ -1,136 +1,278 @@
+import os
+import threading
 import pandas as pd
-import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import pymorphy2
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sentence_transformers import SentenceTransformer
 import warnings
-from collections import Counter
+from embedding_cache import EmbeddingCache
+from similarity_stats import SimilarityStats, sample_similarity_distribution
+from ann_index import IVFIndex, recall_report, normalize, top_k_desc
+from caches import LRUCache
+from parallel_preprocess import preprocess_parallel
+from cluster_terms import ClusterTermStats
+from metrics import Metrics
+from sharded_search import ShardedSearcher
+from feedback_rerank import FeedbackReranker
+from lexical_index import BM25Index
+from dedup import find_near_duplicates
+from normalization import STOP_WORDS, normalize as normalize_text
+from encoders import MODEL_NAME, make_encoder, parity_report
+import storage
+import ingest
+import clustering
 
 warnings.filterwarnings('ignore')
 
+PREPROCESS_VERSION = 1
+DATA_DIR = 'processed_data'
+DEFAULT_N_CLUSTERS = 6
+
 class BERTProcessor:
-    def __init__(self):
+    def __init__(self, data_dir=DATA_DIR, nprobe=1, lemma_cache_size=200000, n_workers=None,
+                 query_cache_size=10000, query_cache_ttl=3600, refit_fraction=0.2, refit_distance_ratio=1.5,
+                 auto_refit=True, vector_dtype='float32', rerank=True, rerank_factor=4, encoder=None,
+                 metrics=None, search_mode='ivf', n_shards=None, search_workers=None, hybrid_candidates=200,
+                 hybrid_weight=0.7, clustering_method='auto', dedup_threshold=0.8, collapse_factor=3,
+                 persist_changes=True, metrics_labels=None, read_only=False, changes_dir=None):
+        self.data_dir = data_dir
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.metrics.add_collector(self._cache_gauges, metrics_labels)
+        self.encoder = encoder
+        self.model_name = getattr(encoder, 'name', MODEL_NAME)
+        self.nprobe = nprobe
+        self.vector_dtype = vector_dtype
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.search_mode = search_mode
+        self.n_shards = n_shards
+        self.search_workers = search_workers
+        self.hybrid_candidates = hybrid_candidates
+        self.hybrid_weight = hybrid_weight
+        self.clustering_method = clustering_method
+        self.dedup_threshold = dedup_threshold
+        self.collapse_factor = collapse_factor
+        self.persist_changes = persist_changes
+        self.read_only = read_only
+        self.changes_dir = changes_dir or data_dir
+        self.change_seq = 0
+        self.replaying = False
+        self.n_workers = n_workers
+        self.lemma_cache = LRUCache(lemma_cache_size)
+        self.query_cache = LRUCache(query_cache_size, ttl=query_cache_ttl)
         self.morph = None
         self.stop_words = None
+        self.status = 'idle'
         self.model = None
         self.df = None
         self.embeddings = None
-        self.similarity_matrix = None 
+        self.similarity_stats = None
         self.kmeans = None
         self.pca = None
         self.clusters = None 
+        self.embedding_cache = None
+        self.index = None
+        self.sharded = None
+        self.lexical = None
+        self.term_stats = None
+        self.refit_fraction = refit_fraction
+        self.refit_distance_ratio = refit_distance_ratio
+        self.auto_refit = auto_refit
+        self.refit_pending = False
+        self.generation = 0
+        self.fit_size = 0
+        self.fit_mean_distance = 0.0
+        self.drift = {'added': 0, 'distance_sum': 0.0}
+        self.lock = threading.RLock()
         
-    def initialize_nltk(self):
-        try:
-            nltk.download('stopwords', quiet=True)
-            nltk.download('punkt', quiet=True)
-        except:
-            pass
-    
     def initialize_tools(self):
-        self.morph = pymorphy2.MorphAnalyzer()
-        
-        nltk_stop_words = set(stopwords.words('russian'))
-        custom_stop_words = {
-            'привет', 'меня', 'звать', 'здравствуйте', 'приветик', 'здарова', 'хай',
-            'это', 'вот', 'ну', 'да', 'нет', 'так', 'еще', 'уже', 'просто', 'очень',
-            'свой', 'моя', 'мой', 'мое', 'работаю', 'работать', 'своя', 'свои', 'своей',
-            'свою', 'своих', 'который', 'которая', 'которые', 'которым', 'которыми',
-            'любить','нравится','хотеть','уметь','слушать','искать','заниматься',
-            'смотреть', 'обожать', 'девушка','парень','человек', 'фильм','музыка',
-            'здорово', 'фанат','работа','жизнь', 'реалистичный', 'фанат',
-            'мужчина','увлекаться','любимый','изучать','хобби', 'женщина',
-            'мечтать','весь', 'создавать', 'коллекционировать','специалист','время',
-            'помогать','сериал', 'создание','классический','система', 'свободный','умный',
-            'звук','городской', 'ценить', 'искусство', 'история', 'исторический', 'оценить',
-            'разрабатывать','старинный','ребёнок', 'редкий', 'разный', 'музей',
-            'мастер','древний','традиционный', 'возвращать','красота','встреча',
-            'коллекциониий','коллекционирование', 'изучение', 'год'
-        }
-        self.stop_words = nltk_stop_words.union(custom_stop_words)
+        if self.morph is None:
+            import pymorphy2
+
+            self.morph = pymorphy2.MorphAnalyzer()
+        self.stop_words = STOP_WORDS
     
+    def lemmatize(self, token):
+        lemma = self.lemma_cache.get(token)
+        if lemma is None:
+            lemma = self.morph.parse(token)[0].normal_form
+            self.lemma_cache.put(token, lemma)
+        return lemma
+
+    def load_lemma_cache(self):
+        return self.lemma_cache.load(os.path.join(self.data_dir, 'lemma_cache.json'))
+
+    def save_lemma_cache(self):
+        if self.read_only:
+            return
+        self.lemma_cache.save(os.path.join(self.data_dir, 'lemma_cache.json'))
+
     def preprocess_text(self, text):
-        if not isinstance(text, str) or not text.strip():
-            return ""
-        
-        text = text.lower()
-        text = re.sub(r'[^а-яё\s]', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        tokens = word_tokenize(text, language='russian')
-        
-        cleaned_tokens = []
-        for token in tokens:
-            if token not in self.stop_words and len(token) > 2:
-                parsed = self.morph.parse(token)[0]
-                lemma = parsed.normal_form
-                if lemma not in self.stop_words and len(lemma) > 2:
-                    cleaned_tokens.append(lemma)
-                    
-        return " ".join(cleaned_tokens)
+        return normalize_text(text, self.lemmatize, self.stop_words)
 
-    def load_and_clean_data(self, excel_path='base_doc.xlsx'):
-        self.df = pd.read_excel(excel_path)
+    def read_data(self, excel_path='base_doc.xlsx'):
+        self.df = storage.read_profiles(excel_path)
+        self.lexical = None
         self.df = self.df.dropna(subset=['Описание'])
         self.df = self.df[self.df['Описание'].str.strip() != '']
-        
-        self.initialize_nltk()
+        return self.df
+
+    def preprocess_data(self):
         self.initialize_tools()
+        self.load_lemma_cache()
         
-        self.df['processed_text'] = self.df['Описание'].apply(self.preprocess_text)
+        descriptions = self.df['Описание']
+        unique = pd.unique(descriptions)
+        processed = preprocess_parallel(self, unique, n_workers=self.n_workers)
+        self.df['processed_text'] = descriptions.map(dict(zip(unique, processed)))
+        self.save_lemma_cache()
+        
+        self.mark_duplicates()
         return self.df
 
+    def mark_duplicates(self):
+        if self.dedup_threshold is None:
+            return
+        with self.metrics.timer('dedup'):
+            groups = find_near_duplicates(self.df['processed_text'], threshold=self.dedup_threshold)
+        self.df['dup_group'] = self.df.index[groups]
+
+    def load_and_clean_data(self, excel_path='base_doc.xlsx'):
+        self.read_data(excel_path)
+        return self.preprocess_data()
+
+    def load_model(self):
+        if self.model is None:
+            self.model = self.encoder if self.encoder is not None else make_encoder('torch')
+            self.model.load()
+        return self.model
+
+    def load_embedding_cache(self):
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(self.data_dir, 'embedding_cache.npz'), self.model_name, PREPROCESS_VERSION
+        ).load()
+        return self.embedding_cache
+
     def create_bert_embeddings(self):
-        self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        self.embeddings = self.model.encode(self.df['processed_text'].tolist(), show_progress_bar=True)
-        self.similarity_matrix = cosine_similarity(self.embeddings) 
+        self.load_model()
+        
+        texts = self.df['processed_text'].tolist()
+        rows = np.arange(len(texts))
+        if 'dup_group' in self.df.columns:
+            groups = self.df.index.get_indexer(self.df['dup_group'])
+            representatives, rows = np.unique(groups, return_inverse=True)
+            texts = [texts[position] for position in representatives]
+        
+        self.load_embedding_cache()
+        self.embeddings = self.embedding_cache.encode(texts, self.model.encode, show_progress_bar=True)[rows]
+        self.embedding_cache.prune(texts)
+        self.embedding_cache.save()
+        self.similarity_stats = SimilarityStats.from_embeddings(self.embeddings)
         return self.embeddings
 
-    def perform_clustering(self, n_clusters=6):
-        self.kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        self.clusters = self.kmeans.fit_predict(self.embeddings)
+    def resolve_n_clusters(self, n_clusters):
+        if n_clusters != 'auto':
+            return n_clusters, None
+        report, kmeans = clustering.load_sweep(self.data_dir)
+        if report is None:
+            return DEFAULT_N_CLUSTERS, None
+        return report['best_k'], kmeans.cluster_centers_
+
+    def select_n_clusters(self, k_values=range(2, 16), sample_size=50000, silhouette_size=10000, n_jobs=-1):
+        report, kmeans = clustering.sweep_k(
+            self.embeddings, k_values, sample_size=sample_size, silhouette_size=silhouette_size, n_jobs=n_jobs
+        )
+        clustering.save_sweep(self.data_dir, report, kmeans)
+        return report
+
+    def perform_clustering(self, n_clusters=DEFAULT_N_CLUSTERS, with_pca=False, method=None):
+        n_clusters, init = self.resolve_n_clusters(n_clusters)
+        self.kmeans, self.clusters = clustering.fit_kmeans(
+            self.embeddings, n_clusters, method or self.clustering_method, init=init
+        )
         self.df['cluster'] = self.clusters
+        self.reset_cluster_state()
         
-        self.pca = PCA(n_components=2)
-        vectors_2d = self.pca.fit_transform(self.embeddings)
-        self.df['pca_x'] = vectors_2d[:, 0]
-        self.df['pca_y'] = vectors_2d[:, 1]
+        if with_pca:
+            self.compute_pca()
         
         return self.clusters
 
+    def compute_pca(self):
+        self.pca = clustering.fit_pca(self.embeddings)
+        vectors_2d = clustering.transform_pca(self.pca, self.embeddings)
+        self.df['pca_x'] = vectors_2d[:, 0]
+        self.df['pca_y'] = vectors_2d[:, 1]
+        return vectors_2d
+
+    def pca_coordinates(self):
+        with self.lock:
+            if self.pca is None or 'pca_x' not in self.df.columns:
+                self.compute_pca()
+            return self.df[['pca_x', 'pca_y']]
+
+    def reset_cluster_state(self, term_stats=None):
+        self.query_cache.clear()
+        if term_stats is None:
+            term_stats = ClusterTermStats.build(self.df['processed_text'], self.clusters)
+        self.term_stats = term_stats
+        self.fit_size = len(self.embeddings)
+        self.fit_mean_distance = self.kmeans.inertia_ / max(self.fit_size, 1)
+        self.drift = {'added': 0, 'distance_sum': 0.0}
+
+    def _build_index(self, embeddings, centroids, clusters):
+        if self.read_only:
+            return IVFIndex.build(embeddings, centroids, clusters, nprobe=self.nprobe, dtype=self.vector_dtype)
+        return IVFIndex.build_on_disk(embeddings, centroids, clusters, os.path.join(self.data_dir, 'ivf_index'),
+                                      nprobe=self.nprobe, dtype=self.vector_dtype)
+
+    def build_index(self):
+        self.index = self._build_index(self.embeddings, self.kmeans.cluster_centers_, self.clusters)
+        return self.index
+
+    def load_index(self):
+        self.index = IVFIndex.load(os.path.join(self.data_dir, 'ivf_index'))
+        self.index.nprobe = self.nprobe
+        return self.index
+
+    def exact_searcher(self):
+        with self.lock:
+            if self.sharded is None or self.sharded.embeddings is not self.embeddings:
+                self.drop_exact_searcher()
+                self.sharded = ShardedSearcher(self.embeddings, self.n_shards, self.search_workers)
+            return self.sharded
+
+    def drop_exact_searcher(self):
+        if self.sharded is not None:
+            self.sharded.close()
+            self.sharded = None
+
+    def lexical_index(self):
+        with self.lock:
+            if self.lexical is None:
+                self.lexical = BM25Index.build(self.df.index, self.df['processed_text'])
+            return self.lexical
+
+    def encoder_parity_report(self, candidate, texts=None, n_texts=200, top_k=20):
+        if texts is None:
+            texts = self.df['processed_text'].sample(min(n_texts, len(self.df)), random_state=42).tolist()
+        return parity_report(self.load_model(), candidate, texts, processor=self, top_k=top_k)
+
+    def index_recall_report(self, k=20, nprobes=(1, 2, 3), n_queries=200):
+        with self.lock:
+            return recall_report(self.index, self.embeddings, k=k, nprobes=nprobes, n_queries=n_queries)
+
     def get_cluster_info(self, cluster_id):
-        cluster_data = self.df[self.df['cluster'] == cluster_id]
-        if len(cluster_data) == 0:
-            return {'size': 0, 'top_themes': []}
-            
-        all_words = []
-        for text in cluster_data['processed_text']:
-            all_words.extend(text.split())
-        
-        top_themes = Counter(all_words).most_common(10)
-        
-        return {
-            'size': len(cluster_data),
-            'top_themes': top_themes
-        }
+        with self.lock:
+            return self.term_stats.info(cluster_id)
 
-    def predict_cluster_for_text(self, text):
-        processed_text = self.preprocess_text(text)
-        if not processed_text:
-            return {'cluster': -1, 'confidence': 0.0, 'error': 'Пустой текст'}
-            
-        vec = self.model.encode([processed_text])
-        cluster = self.kmeans.predict(vec)[0]
-        dist = self.kmeans.transform(vec)[0][cluster]
+    def cluster_result(self, processed_text, cluster, dist, cluster_infos=None):
+        if cluster_infos is None:
+            cluster_info = self.get_cluster_info(cluster)
+        else:
+            if cluster not in cluster_infos:
+                cluster_infos[cluster] = self.get_cluster_info(cluster)
+            cluster_info = cluster_infos[cluster]
         confidence = 1.0 / (1.0 + dist)
         
-        cluster_info = self.get_cluster_info(cluster)
-        
         return {
             'cluster': int(cluster),
             'confidence': float(confidence),
@@ -139,65 +281,534 @@ class BERTProcessor:
             'top_themes': cluster_info['top_themes']
         }
 
-    def find_similar_profiles(self, user_text, top_k=20):
-        processed = self.preprocess_text(user_text)
-        if not processed: return pd.DataFrame()
+    def _results_frame(self, positions, sims):
+        rows = self.df.iloc[positions]
+        return pd.DataFrame({
+            'index': rows.index,
+            'similarity': sims,
+            'description': rows['Описание'].values,
+            'cluster': rows['cluster'].values
+        })
+
+    def encode_queries(self, processed_texts, batch_size=256):
+        entries = [self.query_cache.get(text) for text in processed_texts]
+        missing = list(dict.fromkeys(text for text, entry in zip(processed_texts, entries) if entry is None))
         
-        vec = self.model.encode([processed])
+        self.metrics.inc('query_cache_hits', len(processed_texts) - len(missing))
+        if missing:
+            with self.metrics.timer('encode'):
+                vecs = np.asarray(self.model.encode(missing, batch_size=batch_size), dtype=np.float32)
+            with self.metrics.timer('kmeans_predict'):
+                dists = self.kmeans.transform(vecs)
+            clusters = dists.argmin(axis=1)
+            fresh = {}
+            for text, vec, row, cluster in zip(missing, vecs, dists, clusters):
+                fresh[text] = {'embedding': vec, 'cluster': int(cluster), 'distance': float(row[cluster])}
+                self.query_cache.put(text, fresh[text])
+            entries = [fresh[text] if entry is None else entry for text, entry in zip(processed_texts, entries)]
+        return entries
+
+    def encode_query(self, processed_text):
+        return self.encode_queries([processed_text])[0]
+
+    def predict_cluster_for_text(self, text):
+        with self.metrics.timer('predict_cluster_for_text'):
+            self.metrics.inc('predict_requests')
+            with self.metrics.timer('preprocess'):
+                processed_text = self.preprocess_text(text)
+            if not processed_text:
+                return {'cluster': -1, 'confidence': 0.0, 'error': 'Пустой текст'}
+                
+            entry = self.encode_query(processed_text)
+            
+            return self.cluster_result(processed_text, entry['cluster'], entry['distance'])
+
+    def find_similar_profiles(self, user_text, top_k=20, nprobe=None, mode=None, collapse=False):
+        with self.metrics.timer('find_similar_profiles'):
+            self.metrics.inc('search_requests')
+            with self.metrics.timer('preprocess'):
+                processed = self.preprocess_text(user_text)
+            if not processed: return pd.DataFrame()
+            
+            vec = self.encode_query(processed)['embedding']
+            return self.find_similar_by_vector(vec, top_k, nprobe, mode, text=processed, collapse=collapse)
+
+    def find_similar_by_vector(self, vec, top_k=20, nprobe=None, mode=None, text=None, collapse=False):
+        with self.lock:
+            if collapse and 'dup_group' in self.df.columns:
+                fetch = top_k * self.collapse_factor
+                while True:
+                    results = self.find_similar_by_vector(vec, fetch, nprobe, mode, text)
+                    collapsed = self._collapse_duplicates(results, top_k)
+                    if len(collapsed) >= top_k or len(results) < fetch or fetch >= len(self.df):
+                        return collapsed
+                    fetch *= 4
         
-        predicted_cluster = self.kmeans.predict(vec)[0]
+            mode = mode or self.search_mode
+            if mode == 'hybrid' and text:
+                return self._hybrid_search(text, vec, top_k, nprobe)
+            if mode == 'exact':
+                with self.metrics.timer('exact_search'):
+                    positions, sims = self.exact_searcher().search(vec, top_k)
+                with self.metrics.timer('results_frame'):
+                    return self._results_frame(positions, sims)
         
-        cluster_mask = self.df['cluster'] == predicted_cluster
+            with self.metrics.timer('index_search'):
+                positions, sims = self.index.search(vec, top_k=self._candidate_count(top_k), nprobe=nprobe)
+            with self.metrics.timer('rerank'):
+                positions, sims = self._rerank(vec, positions, sims, top_k)
         
-        if not cluster_mask.any():
-            target_embeddings = self.embeddings
-            target_df = self.df
-        else:
-            target_embeddings = self.embeddings[cluster_mask]
-            target_df = self.df[cluster_mask]
-        
-        sims = cosine_similarity(vec, target_embeddings)[0]
-        indices = np.argsort(sims)[::-1][:top_k]
-        
-        results = []
-        for idx in indices:
-            results.append({
-                'index': target_df.index[idx], 
-                'similarity': sims[idx],
-                'description': target_df.iloc[idx]['Описание'],
-                'cluster': target_df.iloc[idx]['cluster']
-            })
-        return pd.DataFrame(results)
+            with self.metrics.timer('results_frame'):
+                return self._results_frame(positions, sims)
 
-    def get_dataset_stats(self):
-        if self.df is None: return None
+    def _hybrid_search(self, processed_text, vec, top_k, nprobe=None):
+        with self.metrics.timer('lexical_search'):
+            labels, bm25 = self.lexical_index().search(processed_text, max(self.hybrid_candidates, top_k))
+        if len(labels) < top_k:
+            return self.find_similar_by_vector(vec, top_k, nprobe, mode='ivf')
+        
+        with self.metrics.timer('dense_rescore'):
+            positions = self.df.index.get_indexer(labels)
+            sims = normalize(self.embeddings[positions]) @ normalize(vec)
+            fused = self.hybrid_weight * sims + (1.0 - self.hybrid_weight) * bm25 / bm25[0]
+            order = top_k_desc(fused, top_k)
+        
+        with self.metrics.timer('results_frame'):
+            return self._results_frame(positions[order], sims[order]).assign(score=fused[order])
+
+    def _collapse_duplicates(self, results, top_k):
+        if results.empty:
+            return results
+        groups = self.df['dup_group'].reindex(results['index']).to_numpy()
+        keep = ~pd.Series(groups).duplicated().to_numpy()
+        return results[keep].head(top_k).reset_index(drop=True)
+
+    def feedback_session(self, user_text, top_k=20, pool_size=100, collapse=False):
+        processed = self.preprocess_text(user_text)
+        if not processed:
+            return None
+        return FeedbackReranker(self, self.encode_query(processed)['embedding'], top_k=top_k, pool_size=pool_size,
+                                collapse=collapse)
+
+    def _candidate_count(self, top_k):
+        if self.rerank and self.index.dtype != 'float32':
+            return top_k * self.rerank_factor
+        return top_k
+
+    def _rerank(self, vec, positions, sims, top_k):
+        if not self.rerank or self.index.dtype == 'float32' or len(positions) == 0:
+            return positions[:top_k], sims[:top_k]
+        exact = normalize(self.embeddings[positions]) @ normalize(vec)
+        order = top_k_desc(exact, top_k)
+        return positions[order], exact[order]
+
+    def _encode_batch(self, texts, batch_size):
+        with self.metrics.timer('batch_preprocess'):
+            processed = [self.preprocess_text(text) for text in texts]
+        valid = [i for i, text in enumerate(processed) if text]
+        entries = self.encode_queries([processed[i] for i in valid], batch_size=batch_size)
+        return processed, valid, entries
+
+    def predict_clusters_batch(self, texts, batch_size=256):
+        processed, valid, entries = self._encode_batch(texts, batch_size)
+        results = [{'cluster': -1, 'confidence': 0.0, 'error': 'Пустой текст'} for _ in processed]
         
+        cluster_infos = {}
+        for i, entry in zip(valid, entries):
+            results[i] = self.cluster_result(processed[i], entry['cluster'], entry['distance'], cluster_infos)
+        return results
+
+    def find_similar_profiles_batch(self, texts, top_k=20, nprobe=None, batch_size=256, query_chunk=1024, mode=None):
+        processed, valid, entries = self._encode_batch(texts, batch_size)
+        results = [pd.DataFrame() for _ in processed]
+        with self.lock:
+            mode = mode or self.search_mode
+            exact = mode == 'exact'
+            if mode == 'hybrid':
+                for i, entry in zip(valid, entries):
+                    results[i] = self._hybrid_search(processed[i], entry['embedding'], top_k, nprobe)
+                return results
+        
+            for start in range(0, len(valid), query_chunk):
+                vecs = np.stack([entry['embedding'] for entry in entries[start:start + query_chunk]])
+                if exact:
+                    chunk = self.exact_searcher().search_batch(vecs, top_k)
+                    for i, (positions, sims) in zip(valid[start:start + query_chunk], chunk):
+                        results[i] = self._results_frame(positions, sims)
+                    continue
+                chunk = self.index.search_batch(vecs, top_k=self._candidate_count(top_k), nprobe=nprobe)
+                for i, vec, (positions, sims) in zip(valid[start:start + query_chunk], vecs, chunk):
+                    results[i] = self._results_frame(*self._rerank(vec, positions, sims, top_k))
+            return results
+
+    def get_cache_stats(self):
         stats = {
-            'total_profiles': len(self.df),
-            'clusters_count': len(self.df['cluster'].unique()) if 'cluster' in self.df.columns else 0,
+            'query': self.query_cache.stats(),
+            'lemma': self.lemma_cache.stats()
         }
-        if 'cluster' in self.df.columns:
-            stats['cluster_sizes'] = self.df['cluster'].value_counts().to_dict()
-        if self.embeddings is not None:
-            stats['embedding_dimensions'] = self.embeddings.shape[1]
-        if self.similarity_matrix is not None:
-            triu_indices = np.triu_indices_from(self.similarity_matrix, k=1)
-            stats['avg_similarity'] = np.mean(self.similarity_matrix[triu_indices])
-            
+        if self.embedding_cache is not None:
+            stats['embedding'] = self.embedding_cache.stats()
         return stats
 
-    def save_processed_data(self, output_path='processed_base_doc.xlsx'):
+    def _cache_gauges(self):
+        gauges = {}
+        for name, stats in self.get_cache_stats().items():
+            gauges[f'{name}_cache_hit_rate'] = stats['hit_rate']
+            gauges[f'{name}_cache_size'] = stats['size']
+        return gauges
+
+    def _encode_profiles(self, descriptions):
+        processed = [self.preprocess_text(text) for text in descriptions]
+        vecs = self.embedding_cache.encode(processed, self.model.encode)
+        dists = self.kmeans.transform(vecs)
+        clusters = dists.argmin(axis=1)
+        return processed, vecs, clusters, dists[np.arange(len(clusters)), clusters]
+
+    def _track_drift(self, distances):
+        self.drift['added'] += len(distances)
+        self.drift['distance_sum'] += float(np.sum(np.square(distances)))
+        
+        added = self.drift['added']
+        grown = added / max(self.fit_size, 1) > self.refit_fraction
+        shifted = (added >= 50 and
+                   self.drift['distance_sum'] / added > self.fit_mean_distance * self.refit_distance_ratio)
+        if (grown or shifted) and not self.refit_pending:
+            self.refit_pending = True
+            if self.auto_refit:
+                threading.Thread(target=self.refit, daemon=True).start()
+
+    def add_profiles(self, descriptions):
+        descriptions = [text for text in descriptions if isinstance(text, str) and text.strip()]
+        if not descriptions:
+            return []
+        
+        with self.lock:
+            self.generation += 1
+            processed, vecs, clusters, distances = self._encode_profiles(descriptions)
+            start = int(self.df.index.max()) + 1 if len(self.df) else 0
+            labels = list(range(start, start + len(descriptions)))
+            
+            new_rows = pd.DataFrame({
+                'Описание': descriptions,
+                'processed_text': processed,
+                'cluster': clusters
+            }, index=labels)
+            if 'dup_group' in self.df.columns:
+                new_rows['dup_group'] = labels
+            if self.pca is not None:
+                vectors_2d = self.pca.transform(vecs)
+                new_rows['pca_x'] = vectors_2d[:, 0]
+                new_rows['pca_y'] = vectors_2d[:, 1]
+            
+            first_position = len(self.df)
+            self.df = pd.concat([self.df, new_rows])
+            self.embeddings = np.vstack([self.embeddings, vecs])
+            self.clusters = np.concatenate([self.clusters, clusters])
+            
+            self.index.add(vecs, clusters, np.arange(first_position, first_position + len(labels)))
+            self.similarity_stats.add(vecs)
+            for text, cluster in zip(processed, clusters):
+                self.term_stats.add(text, cluster)
+            if self.lexical is not None:
+                for label, text in zip(labels, processed):
+                    self.lexical.add(label, text)
+            self._log_changes([
+                {'op': 'add', 'label': label, 'key': storage.change_key(text), 'description': text}
+                for label, text in zip(labels, descriptions)
+            ])
+            self._track_drift(distances)
+        return labels
+
+    def _leave_dup_group(self, index):
+        if 'dup_group' not in self.df.columns:
+            return
+        groups = self.df['dup_group']
+        members = self.df.index[(groups == groups.at[index]).to_numpy() & (self.df.index != index)]
+        if len(members) and groups.at[index] == index:
+            self.df.loc[members, 'dup_group'] = members.min()
+
+    def update_profile(self, index, description):
+        with self.lock:
+            self.generation += 1
+            position = self.df.index.get_loc(index)
+            key = storage.change_key(self.df.at[index, 'Описание'])
+            processed, vecs, clusters, distances = self._encode_profiles([description])
+            
+            self.index.remove([position], compact=False)
+            self.similarity_stats.remove(self.embeddings[position])
+            self.term_stats.remove(self.df['processed_text'].iat[position], self.clusters[position])
+            if self.lexical is not None:
+                self.lexical.remove(index, self.df['processed_text'].iat[position])
+            
+            self.df.at[index, 'Описание'] = description
+            self.df.at[index, 'processed_text'] = processed[0]
+            self.df.at[index, 'cluster'] = clusters[0]
+            if 'dup_group' in self.df.columns:
+                self._leave_dup_group(index)
+                self.df.at[index, 'dup_group'] = index
+            if self.pca is not None:
+                vectors_2d = self.pca.transform(vecs)
+                self.df.at[index, 'pca_x'] = vectors_2d[0, 0]
+                self.df.at[index, 'pca_y'] = vectors_2d[0, 1]
+            self.embeddings[position] = vecs[0]
+            self.clusters[position] = clusters[0]
+            self.drop_exact_searcher()
+            
+            self.index.add(vecs, clusters, [position])
+            self.similarity_stats.add(vecs)
+            self.term_stats.add(processed[0], clusters[0])
+            if self.lexical is not None:
+                self.lexical.add(index, processed[0])
+            self._log_changes([{'op': 'update', 'label': index, 'key': key, 'description': description}])
+            self._track_drift(distances)
+
+    def remove_profile(self, index):
+        with self.lock:
+            self.generation += 1
+            position = self.df.index.get_loc(index)
+            key = storage.change_key(self.df.at[index, 'Описание'])
+            
+            self.index.remove([position])
+            self.similarity_stats.remove(self.embeddings[position])
+            self.term_stats.remove(self.df['processed_text'].iat[position], self.clusters[position])
+            if self.lexical is not None:
+                self.lexical.remove(index, self.df['processed_text'].iat[position])
+            
+            self._leave_dup_group(index)
+            self.df = self.df.drop(index)
+            self.embeddings = np.delete(self.embeddings, position, axis=0)
+            self.clusters = np.delete(self.clusters, position)
+            self._log_changes([{'op': 'remove', 'label': index, 'key': key}])
+
+    def _log_changes(self, entries):
+        if not self.persist_changes or self.replaying or (self.read_only and self.changes_dir == self.data_dir):
+            return
+        for entry in entries:
+            entry['label'] = int(entry['label'])
+        self.change_seq = storage.append_changes(self.changes_dir, entries)
+
+    def _resolve_change(self, entry, rows):
+        key = entry.get('key')
+        if key is None:
+            return entry['label'] if entry['label'] in self.df.index else None
+        labels = rows.get(key)
+        if not labels:
+            return None
+        return entry['label'] if entry['label'] in labels else labels[0]
+
+    def replay_changes(self, applied_seq=0):
+        entries = storage.read_changes(self.changes_dir)
+        pending = [entry for entry in entries if entry['seq'] > applied_seq]
+        self.change_seq = max([applied_seq] + [entry['seq'] for entry in entries])
+        if not pending:
+            return 0
+        
+        rows = {}
+        for label, text in self.df['Описание'].items():
+            rows.setdefault(storage.change_key(text), []).append(label)
+        self.replaying = True
+        try:
+            for entry in pending:
+                if entry['op'] == 'add':
+                    key = storage.change_key(entry['description'])
+                    if not rows.get(key):
+                        rows.setdefault(key, []).extend(self.add_profiles([entry['description']]))
+                    continue
+                label = self._resolve_change(entry, rows)
+                if label is None:
+                    continue
+                rows[storage.change_key(self.df.at[label, 'Описание'])].remove(label)
+                if entry['op'] == 'update':
+                    self.update_profile(label, entry['description'])
+                    rows.setdefault(storage.change_key(entry['description']), []).append(label)
+                else:
+                    self.remove_profile(label)
+        finally:
+            self.replaying = False
+        return len(pending)
+
+    def _fit_clusters(self, n_clusters):
+        with self.lock:
+            generation, embeddings, texts = self.generation, self.embeddings, self.df['processed_text']
+            n_clusters, with_pca = n_clusters or self.kmeans.n_clusters, self.pca is not None
+        kmeans, clusters = clustering.fit_kmeans(embeddings, n_clusters, self.clustering_method)
+        pca = clustering.fit_pca(embeddings) if with_pca else None
+        vectors_2d = clustering.transform_pca(pca, embeddings) if with_pca else None
+        term_stats = ClusterTermStats.build(texts, clusters)
+        index = self._build_index(embeddings, kmeans.cluster_centers_, clusters)
+        return generation, kmeans, clusters, pca, vectors_2d, term_stats, index
+
+    def refit(self, n_clusters=None):
+        fitted = self._fit_clusters(n_clusters)
+        with self.lock:
+            if fitted[0] != self.generation:
+                fitted = self._fit_clusters(n_clusters)
+            _, self.kmeans, self.clusters, pca, vectors_2d, term_stats, self.index = fitted
+            self.df['cluster'] = self.clusters
+            if pca is not None:
+                self.pca = pca
+                self.df['pca_x'] = vectors_2d[:, 0]
+                self.df['pca_y'] = vectors_2d[:, 1]
+            self.reset_cluster_state(term_stats)
+            self.refit_pending = False
+
+    def get_dataset_stats(self):
+        with self.lock:
+            if self.df is None: return None
+        
+            stats = {
+                'total_profiles': len(self.df),
+                'clusters_count': len(self.df['cluster'].unique()) if 'cluster' in self.df.columns else 0,
+            }
+            if 'cluster' in self.df.columns:
+                stats['cluster_sizes'] = self.df['cluster'].value_counts().to_dict()
+            if self.embeddings is not None:
+                stats['embedding_dimensions'] = self.embeddings.shape[1]
+            if self.similarity_stats is not None:
+                stats['avg_similarity'] = self.similarity_stats.mean_pairwise
+            if 'dup_group' in self.df.columns:
+                stats['duplicate_profiles'] = int(len(self.df) - self.df['dup_group'].nunique())
+            
+            return stats
+
+    def memory_usage(self):
+        with self.lock:
+            arrays = [self.embeddings, self.clusters]
+            if self.index is not None:
+                arrays += list(self.index.list_ids) + list(self.index.list_vectors)
+            total = sum(int(array.nbytes) for array in arrays if array is not None)
+            if self.df is not None:
+                total += int(self.df.memory_usage(deep=True).sum())
+            return total
+
+    def close(self):
+        self.drop_exact_searcher()
+        self.metrics.remove_collector(self._cache_gauges)
+
+    def get_similarity_distribution(self, n_pairs=10000, bins=20):
+        if self.embeddings is None: return None
+        return sample_similarity_distribution(self.embeddings, n_pairs=n_pairs, bins=bins)
+
+    def _storage_params(self):
+        deduplicated = self.df is not None and 'dup_group' in self.df.columns
+        return {
+            'model_name': self.model_name,
+            'preprocess_version': PREPROCESS_VERSION,
+            'dedup_threshold': self.dedup_threshold if deduplicated else None,
+            'changes_seq': self.change_seq,
+            'n_clusters': int(self.kmeans.n_clusters) if self.kmeans is not None else None
+        }
+
+    def save_processed_data(self, excel_path='base_doc.xlsx', arrays=True):
+        if self.read_only:
+            return
+        if self.df is not None:
+            meta = dict(storage.source_fingerprint(excel_path), **self._storage_params())
+            models = {'kmeans': self.kmeans, 'pca': self.pca}
+            storage.save_processed(self.data_dir, self.df, self.embeddings if arrays else None, models, meta)
+        if self.index is not None and arrays:
+            self.index.save(os.path.join(self.data_dir, 'ivf_index'))
+        self.save_lemma_cache()
+
+    def export_excel(self, output_path='processed_base_doc.xlsx'):
         if self.df is not None:
             self.df.to_excel(output_path, index=False)
 
-    def load_and_process_data(self, excel_path='base_doc.xlsx', n_clusters=6):
-        self.load_and_clean_data(excel_path)
-        self.create_bert_embeddings()
-        self.perform_clustering(n_clusters)
-        self.save_processed_data()
+    def is_processed_data_fresh(self, excel_path='base_doc.xlsx', n_clusters=DEFAULT_N_CLUSTERS):
+        n_clusters, _ = self.resolve_n_clusters(n_clusters)
+        return storage.is_fresh(
+            self.data_dir, excel_path,
+            model_name=self.model_name, preprocess_version=PREPROCESS_VERSION, n_clusters=n_clusters,
+            dedup_threshold=self.dedup_threshold
+        )
+
+    def load_processed_data(self):
+        self.status = 'loading_data'
+        self.df, self.embeddings, models, meta = storage.load_processed(self.data_dir, mmap_mode='c')
+        self.lexical = None
+        self.kmeans = models['kmeans']
+        self.pca = models['pca']
+        self.clusters = self.df['cluster'].to_numpy(copy=True)
+        
+        self.status = 'loading_tools'
+        self.initialize_tools()
+        self.load_lemma_cache()
+        self.status = 'loading_model'
+        self.load_model()
+        self.load_embedding_cache()
+        
+        self.status = 'loading_index'
+        self.similarity_stats = SimilarityStats.from_embeddings(self.embeddings)
+        self.reset_cluster_state()
+        try:
+            self.load_index()
+        except (OSError, KeyError, ValueError):
+            self.build_index()
+        if len(self.index) != len(self.df) or self.index.dtype != self.vector_dtype:
+            self.build_index()
+        self.replay_changes((meta or {}).get('changes_seq', 0))
+        self.status = 'ready'
+        return self.df, self.embeddings
+
+    def ingest(self, source_path, n_clusters=DEFAULT_N_CLUSTERS, chunk_size=10000, resume=True):
+        self.status = 'ingesting'
+        params = {'model_name': self.model_name, 'preprocess_version': PREPROCESS_VERSION}
+        with self.metrics.timer('startup_ingest'):
+            ingest.ingest_profiles(self, source_path, self.data_dir, params, chunk_size=chunk_size, resume=resume)
+            self.df, self.embeddings = storage.load_profiles(self.data_dir, mmap_mode='c')
+            self.lexical = None
+            self.load_embedding_cache()
+            self.embedding_cache.reset(self.df['processed_text'], self.embeddings)
+            self.embedding_cache.save()
+            self.similarity_stats = SimilarityStats.from_embeddings(self.embeddings)
+            self.mark_duplicates()
+        self.status = 'clustering'
+        with self.metrics.timer('startup_clustering'):
+            self.perform_clustering(n_clusters)
+        self.status = 'indexing'
+        with self.metrics.timer('startup_index'):
+            self.build_index()
+        replayed = self.replay_changes()
+        self.status = 'saving'
+        with self.metrics.timer('startup_save'):
+            self.save_processed_data(source_path, arrays=bool(replayed))
+        ingest.cleanup(self.data_dir)
+        self.status = 'ready'
         return self.df, self.embeddings
 
-bert_processor = BERTProcessor()
+    def load_and_process_data(self, excel_path='base_doc.xlsx', n_clusters=DEFAULT_N_CLUSTERS, streaming=False, chunk_size=10000):
+        if self.is_processed_data_fresh(excel_path, n_clusters):
+            with self.metrics.timer('startup_load_processed'):
+                return self.load_processed_data()
+        if streaming:
+            return self.ingest(excel_path, n_clusters, chunk_size=chunk_size)
+        
+        self.status = 'reading'
+        with self.metrics.timer('startup_read'):
+            self.read_data(excel_path)
+        self.status = 'preprocessing'
+        with self.metrics.timer('startup_preprocess'):
+            self.preprocess_data()
+        self.status = 'encoding'
+        with self.metrics.timer('startup_encode'):
+            self.create_bert_embeddings()
+        self.status = 'clustering'
+        with self.metrics.timer('startup_clustering'):
+            self.perform_clustering(n_clusters)
+        self.status = 'indexing'
+        with self.metrics.timer('startup_index'):
+            self.build_index()
+        self.replay_changes()
+        self.status = 'saving'
+        with self.metrics.timer('startup_save'):
+            self.save_processed_data(excel_path)
+        self.status = 'ready'
+        return self.df, self.embeddings
+
+bert_processor = BERTProcessor(
+    encoder=make_encoder(os.environ.get('FRIENDFINDER_ENCODER', 'torch')),
+    metrics=Metrics(enabled=os.environ.get('FRIENDFINDER_METRICS') == '1')
+)
 
 def initialize_processor():
     return bert_processor.load_and_process_data()
@@ -205,5 +816,11 @@ def initialize_processor():
 def predict_user_cluster(user_text):
     return bert_processor.predict_cluster_for_text(user_text)
 
-def find_similar_profiles(user_text, top_k=20):
-    return bert_processor.find_similar_profiles(user_text, top_k)
+def find_similar_profiles(user_text, top_k=20, nprobe=None, mode=None, collapse=False):
+    return bert_processor.find_similar_profiles(user_text, top_k, nprobe, mode, collapse)
+
+def predict_clusters_batch(texts):
+    return bert_processor.predict_clusters_batch(texts)
+
+def find_similar_profiles_batch(texts, top_k=20, nprobe=None, mode=None):
+    return bert_processor.find_similar_profiles_batch(texts, top_k, nprobe, mode=mode)
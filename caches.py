@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш с вытеснением давно неиспользуемых записей
+
+    Если задан ttl (в секундах), записи старше ttl считаются устаревшими.
+    """
+
+    def __init__(self, maxsize=100000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.expires = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl is not None and self.expires[key] < time.monotonic():
+                del self.data[key]
+                del self.expires[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if self.ttl is not None:
+                self.expires[key] = time.monotonic() + self.ttl
+            while len(self.data) > self.maxsize:
+                evicted, _ = self.data.popitem(last=False)
+                self.expires.pop(evicted, None)
+                self.evictions += 1
+
+    def items(self):
+        with self.lock:
+            return list(self.data.items())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.expires.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        items = self.items()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return self
+        try:
+            with open(path, encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return self
+        for key, value in items[-self.maxsize:]:
+            self.put(key, value)
+        return self
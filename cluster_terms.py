@@ -0,0 +1,52 @@
+from collections import Counter
+
+
+class ClusterTermStats:
+    """Частоты слов по кластерам, обновляемые при добавлении и удалении анкет
+
+    Для каждого кластера хранится разреженный счётчик слов и кэш топ-слов,
+    который сбрасывается только при изменении этого кластера.
+    """
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self.counts = {}
+        self.sizes = Counter()
+        self.top = {}
+
+    @classmethod
+    def build(cls, texts, clusters, top_n=10):
+        stats = cls(top_n=top_n)
+        for text, cluster in zip(texts, clusters):
+            stats.add(text, cluster)
+        return stats
+
+    def add(self, text, cluster):
+        cluster = int(cluster)
+        self.counts.setdefault(cluster, Counter()).update(text.split())
+        self.sizes[cluster] += 1
+        self.top.pop(cluster, None)
+
+    def remove(self, text, cluster):
+        cluster = int(cluster)
+        counts = self.counts.get(cluster)
+        if counts is None:
+            return
+        counts.subtract(text.split())
+        for word in set(text.split()):
+            if counts[word] <= 0:
+                del counts[word]
+        self.sizes[cluster] -= 1
+        if self.sizes[cluster] <= 0:
+            del self.sizes[cluster]
+            del self.counts[cluster]
+        self.top.pop(cluster, None)
+
+    def info(self, cluster):
+        cluster = int(cluster)
+        size = self.sizes.get(cluster, 0)
+        if size == 0:
+            return {'size': 0, 'top_themes': []}
+        if cluster not in self.top:
+            self.top[cluster] = self.counts[cluster].most_common(self.top_n)
+        return {'size': size, 'top_themes': self.top[cluster]}
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+import storage
+
+CLUSTERING_DIR = 'clustering'
+SWEEP_FILE = 'k_sweep.json'
+MODEL_FILE = 'kmeans.joblib'
+FULL_KMEANS_MAX_ROWS = 50000
+
+
+def sample_rows(embeddings, size, random_state=42):
+    """Случайная выборка строк; индексы сортируются, чтобы чтение из memmap шло подряд"""
+    if size >= len(embeddings):
+        return np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(random_state)
+    rows = np.sort(rng.choice(len(embeddings), size=size, replace=False))
+    return np.asarray(embeddings[rows], dtype=np.float32)
+
+
+def assign_clusters(kmeans, embeddings, chunk_size=65536):
+    """Метки кластеров и суммарная инерция, посчитанные порциями"""
+    labels = np.empty(len(embeddings), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(embeddings), chunk_size):
+        dists = kmeans.transform(np.asarray(embeddings[start:start + chunk_size], dtype=np.float32))
+        labels[start:start + chunk_size] = dists.argmin(axis=1)
+        inertia += float(np.square(dists.min(axis=1)).sum())
+    return labels, inertia
+
+
+def fit_kmeans(embeddings, n_clusters, method='auto', batch_size=4096, n_epochs=3, init=None,
+               chunk_size=65536, random_state=42):
+    """Обучает KMeans: полный алгоритм для небольших баз, MiniBatchKMeans порциями для больших
+
+    В режиме minibatch центры инициализируются k-means++ по выборке,
+    затем модель проходит по данным n_epochs раз: порции по chunk_size
+    строк читаются в случайном порядке и подаются в partial_fit
+    мини-батчами по batch_size, так что центры обновляются
+    n_epochs · ⌈N / batch_size⌉ раз, а в памяти находится одна порция.
+    inertia_ у модели заменяется на инерцию по всей базе.
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
+
+    if method == 'auto':
+        method = 'full' if len(embeddings) <= FULL_KMEANS_MAX_ROWS else 'minibatch'
+
+    if method == 'full':
+        if init is None:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=random_state)
+        labels = kmeans.fit_predict(np.asarray(embeddings, dtype=np.float32))
+        return kmeans, labels
+
+    if init is None:
+        sample = sample_rows(embeddings, max(n_clusters * 256, batch_size), random_state)
+        init, _ = kmeans_plusplus(sample, n_clusters, random_state=random_state)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, batch_size=batch_size,
+                             random_state=random_state)
+    rng = np.random.default_rng(random_state)
+    starts = np.arange(0, len(embeddings), chunk_size)
+    for _ in range(n_epochs):
+        for start in rng.permutation(starts):
+            chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+            for batch in range(0, len(chunk), batch_size):
+                kmeans.partial_fit(chunk[batch:batch + batch_size])
+
+    labels, kmeans.inertia_ = assign_clusters(kmeans, embeddings, chunk_size)
+    return kmeans, labels
+
+
+def fit_pca(embeddings, n_components=2, chunk_size=65536):
+    """IncrementalPCA по порциям; на небольших базах результат совпадает с PCA"""
+    from sklearn.decomposition import IncrementalPCA
+
+    pca = IncrementalPCA(n_components=n_components)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        if len(chunk) >= n_components:
+            pca.partial_fit(chunk)
+    return pca
+
+
+def transform_pca(pca, embeddings, chunk_size=65536):
+    vectors_2d = np.empty((len(embeddings), pca.n_components_), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        vectors_2d[start:start + chunk_size] = pca.transform(np.asarray(embeddings[start:start + chunk_size]))
+    return vectors_2d
+
+
+def _score_k(sample, k, silhouette_size, random_state):
+    from sklearn.metrics import silhouette_score
+
+    start = time.perf_counter()
+    kmeans, labels = fit_kmeans(sample, k, random_state=random_state)
+    score = silhouette_score(sample, labels, sample_size=min(silhouette_size, len(sample)), random_state=random_state)
+    return {
+        'k': int(k),
+        'silhouette': float(score),
+        'inertia': float(kmeans.inertia_),
+        'seconds': time.perf_counter() - start
+    }, kmeans
+
+
+def sweep_k(embeddings, k_values=range(2, 16), sample_size=50000, silhouette_size=10000, n_jobs=-1,
+            random_state=42):
+    """Подбор числа кластеров: KMeans для каждого k на выборке, параллельно, по силуэту"""
+    from joblib import Parallel, delayed
+
+    sample = sample_rows(embeddings, sample_size, random_state)
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_score_k)(sample, k, silhouette_size, random_state) for k in k_values
+    )
+    scores = [score for score, _ in results]
+    best = max(range(len(scores)), key=lambda i: scores[i]['silhouette'])
+    return {
+        'rows': len(embeddings),
+        'sample_size': len(sample),
+        'silhouette_size': silhouette_size,
+        'best_k': scores[best]['k'],
+        'scores': scores
+    }, results[best][1]
+
+
+def save_sweep(directory, report, kmeans):
+    import joblib
+
+    target = os.path.join(directory, CLUSTERING_DIR)
+    os.makedirs(target, exist_ok=True)
+    joblib.dump(kmeans, os.path.join(target, MODEL_FILE) + '.tmp')
+    os.replace(os.path.join(target, MODEL_FILE) + '.tmp', os.path.join(target, MODEL_FILE))
+    with open(os.path.join(target, SWEEP_FILE) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(os.path.join(target, SWEEP_FILE) + '.tmp', os.path.join(target, SWEEP_FILE))
+
+
+def load_sweep(directory):
+    """Сохранённый результат подбора k и модель лучшего k (или None, None)"""
+    target = os.path.join(directory, CLUSTERING_DIR)
+    try:
+        with open(os.path.join(target, SWEEP_FILE), encoding='utf-8') as f:
+            report = json.load(f)
+        import joblib
+
+        return report, joblib.load(os.path.join(target, MODEL_FILE))
+    except (OSError, ValueError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор числа кластеров по силуэту на сохранённых эмбеддингах')
+    parser.add_argument('--data-dir', default='processed_data')
+    parser.add_argument('--k-min', type=int, default=2)
+    parser.add_argument('--k-max', type=int, default=15)
+    parser.add_argument('--sample-size', type=int, default=50000)
+    parser.add_argument('--silhouette-size', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    _, embeddings = storage.load_profiles(args.data_dir, mmap_mode='r')
+    report, kmeans = sweep_k(
+        embeddings, range(args.k_min, args.k_max + 1), sample_size=args.sample_size,
+        silhouette_size=args.silhouette_size, n_jobs=args.jobs
+    )
+    save_sweep(args.data_dir, report, kmeans)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import zlib
+import numpy as np
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text, size=2):
+    """Множество словесных n-грамм; для коротких текстов — сами слова"""
+    words = text.split()
+    if len(words) < size:
+        return set(words)
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+class MinHashLSH:
+    """MinHash-сигнатуры и LSH по полосам для поиска почти одинаковых текстов
+
+    Сигнатура из num_perm минимумов хэшей делится на bands полос; тексты,
+    совпавшие хотя бы в одной полосе, становятся кандидатами, и для них
+    проверяется точное сходство Жаккара по n-граммам.
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=2, seed=42):
+        if num_perm % bands:
+            raise ValueError('num_perm должно делиться на bands')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingle_set), dtype=np.uint64)
+        values = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return values.min(axis=0)
+
+    def candidate_pairs(self, signatures):
+        pairs = set()
+        for band in range(self.bands):
+            buckets = {}
+            block = signatures[:, band * self.rows:(band + 1) * self.rows]
+            for row, key in enumerate(map(bytes, block)):
+                buckets.setdefault(key, []).append(row)
+            for members in buckets.values():
+                if len(members) > 1:
+                    first = members[0]
+                    pairs.update((first, other) for other in members[1:])
+                    pairs.update(zip(members[1:], members[2:]))
+        return pairs
+
+
+def find_near_duplicates(texts, threshold=0.8, num_perm=64, bands=16, shingle_size=2, seed=42):
+    """Возвращает для каждого текста позицию представителя его группы (первого по порядку)
+
+    Одинаковые тексты объединяются сразу, остальные — через MinHash LSH
+    с проверкой сходства Жаккара не ниже threshold.
+    """
+    texts = list(texts)
+    groups = _UnionFind(len(texts))
+
+    first_seen = {}
+    unique_rows = []
+    for row, text in enumerate(texts):
+        if text in first_seen:
+            groups.union(first_seen[text], row)
+        else:
+            first_seen[text] = row
+            unique_rows.append(row)
+
+    lsh = MinHashLSH(num_perm=num_perm, bands=bands, shingle_size=shingle_size, seed=seed)
+    sets = [shingles(texts[row], shingle_size) for row in unique_rows]
+    if len(unique_rows) > 1:
+        signatures = np.stack([lsh.signature(shingle_set) for shingle_set in sets])
+        for i, j in lsh.candidate_pairs(signatures):
+            if sets[i] and sets[j] and jaccard(sets[i], sets[j]) >= threshold:
+                groups.union(unique_rows[i], unique_rows[j])
+
+    return np.array([groups.find(row) for row in range(len(texts))], dtype=np.int64)
@@ -0,0 +1,109 @@
+import os
+import hashlib
+import numpy as np
+
+
+class EmbeddingCache:
+    """Дисковый кэш эмбеддингов: ключ — хэш (текст, модель, версия препроцессинга)"""
+
+    def __init__(self, path, model_name, preprocess_version):
+        self.path = path
+        self.model_name = model_name
+        self.preprocess_version = preprocess_version
+        self.keys = {}
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, text):
+        raw = f'{self.model_name}\x00{self.preprocess_version}\x00{text}'
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                keys = data['keys']
+                self.vectors = data['vectors']
+        except (OSError, KeyError, ValueError):
+            self.keys = {}
+            self.vectors = None
+            return self
+        self.keys = {key: i for i, key in enumerate(keys.tolist())}
+        return self
+
+    def encode(self, texts, encode_fn, store=True, **encode_kwargs):
+        keys = [self.make_key(text) for text in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.keys and key not in missing:
+                missing[key] = text
+
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values()), **encode_kwargs), dtype=np.float32)
+            if not store:
+                fresh = {key: i for i, key in enumerate(missing)}
+                return np.stack([new_vectors[fresh[key]] if key in fresh else self.vectors[self.keys[key]]
+                                 for key in keys])
+            offset = 0 if self.vectors is None else len(self.vectors)
+            for i, key in enumerate(missing):
+                self.keys[key] = offset + i
+            if self.vectors is None:
+                self.vectors = new_vectors
+            else:
+                self.vectors = np.vstack([self.vectors, new_vectors])
+
+        if not keys:
+            return np.empty((0, 0 if self.vectors is None else self.vectors.shape[1]), dtype=np.float32)
+
+        rows = np.fromiter((self.keys[key] for key in keys), dtype=np.int64, count=len(keys))
+        return self.vectors[rows]
+
+    def prune(self, texts):
+        keep = list(dict.fromkeys(self.make_key(text) for text in texts))
+        keep = [key for key in keep if key in self.keys]
+        if self.vectors is None or not keep:
+            self.keys = {}
+            self.vectors = None
+            return
+        rows = np.array([self.keys[key] for key in keep], dtype=np.int64)
+        self.vectors = self.vectors[rows]
+        self.keys = {key: i for i, key in enumerate(keep)}
+
+    def reset(self, texts, vectors):
+        """Заменяет содержимое кэша векторами texts (по первому вхождению каждого текста)"""
+        first = {}
+        for i, text in enumerate(texts):
+            first.setdefault(self.make_key(text), i)
+        if not first:
+            self.keys = {}
+            self.vectors = None
+            return
+        self.keys = {key: i for i, key in enumerate(first)}
+        self.vectors = np.asarray(vectors[np.fromiter(first.values(), dtype=np.int64, count=len(first))],
+                                  dtype=np.float32)
+
+    def save(self):
+        if self.vectors is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        keys = np.array(sorted(self.keys, key=self.keys.get))
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, keys=keys, vectors=self.vectors)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.keys),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+VECTOR_DTYPES = ('float32', 'float16', 'int8')
+CHUNK_SIZE = 65536
+DOT_BLOCK_ROWS = 4096
+
+
+def quantize(unit_vectors, dtype, scale=None):
+    """Переводит нормированные векторы в float16 или int8 со скалярной квантизацией
+
+    Для int8 используется масштаб по каждой координате: x ≈ code * scale.
+    Возвращает (коды, масштаб); для float-типов масштаб равен None.
+    """
+    unit_vectors = np.asarray(unit_vectors, dtype=np.float32)
+    if dtype == 'float32':
+        return unit_vectors, None
+    if dtype == 'float16':
+        return unit_vectors.astype(np.float16), None
+    if dtype != 'int8':
+        raise ValueError(f'Неизвестный тип векторов: {dtype}')
+
+    if scale is None:
+        scale = np.abs(unit_vectors).max(axis=0) / 127.0 if len(unit_vectors) else np.ones(unit_vectors.shape[1])
+        scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+    codes = np.clip(np.rint(unit_vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def dequantize(codes, scale=None):
+    vectors = np.asarray(codes, dtype=np.float32)
+    return vectors if scale is None else vectors * scale
+
+
+def dot(codes, query, scale=None):
+    """Скалярные произведения кодов с запросом (вектор или матрица запросов) по частям
+
+    Блоки по DOT_BLOCK_ROWS строк переводятся в float32 в один и тот же
+    буфер, который остаётся в кэше процессора. Перевод float16 → float32
+    в numpy заметно дороже, чем int8 → float32: float16 занимает вдвое
+    больше памяти, чем int8, и на одиночных запросах медленнее его в
+    несколько раз. Для низкой задержки выбирайте int8 с rerank, float16 —
+    когда важна точность без пересчёта. Пакет запросов (search_batch)
+    переводит каждый блок один раз на весь пакет.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    if scale is not None:
+        query = query * scale
+    if codes.dtype == np.float32:
+        return codes @ query.T if query.ndim == 2 else codes @ query
+
+    out_shape = (len(codes), len(query)) if query.ndim == 2 else (len(codes),)
+    out = np.empty(out_shape, dtype=np.float32)
+    buffer = np.empty((min(DOT_BLOCK_ROWS, len(codes)),) + codes.shape[1:], dtype=np.float32)
+    for start in range(0, len(codes), DOT_BLOCK_ROWS):
+        chunk = codes[start:start + DOT_BLOCK_ROWS]
+        block = buffer[:len(chunk)]
+        np.copyto(block, chunk)
+        out[start:start + len(chunk)] = block @ query.T if query.ndim == 2 else block @ query
+    return out
+
+
+def save_array(path, array):
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(path + '.tmp', path)
+
+
+def load_array(path, mmap_mode='r'):
+    return np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
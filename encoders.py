@@ -0,0 +1,199 @@
+import os
+import time
+import zlib
+import numpy as np
+
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+ONNX_DIR = os.path.join('processed_data', 'onnx')
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'hashing')
+
+
+class HashingEncoder:
+    """Детерминированный кодировщик без весов модели — для тестов, бенчмарков и локального запуска
+
+    Каждое слово хэшируется в несколько координат вектора со знаком ±1,
+    поэтому тексты с общими словами получают близкие векторы.
+    """
+
+    def __init__(self, dim=384, hashes_per_word=4, name='hashing-encoder'):
+        self.dim = dim
+        self.hashes_per_word = hashes_per_word
+        self.name = name
+
+    def load(self):
+        return self
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                for seed in range(self.hashes_per_word):
+                    h = zlib.crc32(f'{seed}:{word}'.encode('utf-8'))
+                    vectors[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return vectors
+
+
+class SentenceTransformerEncoder:
+    """Исходная модель SentenceTransformer на PyTorch (загружается при первом обращении)"""
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self.name = model_name
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name)
+        return self
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        self.load()
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar, **kwargs)
+
+
+def export_onnx(model_name=MODEL_NAME, output_dir=ONNX_DIR, opset=14):
+    """Экспортирует трансформер из локального кэша HuggingFace в ONNX (однократно)"""
+    path = os.path.join(output_dir, 'model.onnx')
+    if os.path.exists(path):
+        return path
+
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    dummy = tokenizer(['пример текста анкеты'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(dummy[name] for name in input_names), path + '.tmp',
+            input_names=input_names, output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    os.replace(path + '.tmp', path)
+    tokenizer.save_pretrained(output_dir)
+    return path
+
+
+def quantize_onnx(path):
+    """Динамическая int8-квантизация весов ONNX-модели"""
+    quantized_path = path.replace('.onnx', '.int8.onnx')
+    if os.path.exists(quantized_path):
+        return quantized_path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(path, quantized_path + '.tmp', weight_type=QuantType.QInt8)
+    os.replace(quantized_path + '.tmp', quantized_path)
+    return quantized_path
+
+
+class OnnxEncoder:
+    """Та же модель в ONNX Runtime (FP32 или int8) с mean pooling, как у SentenceTransformer"""
+
+    def __init__(self, model_name=MODEL_NAME, quantized=False, output_dir=ONNX_DIR, max_length=128, num_threads=None):
+        self.model_name = model_name
+        self.quantized = quantized
+        self.output_dir = output_dir
+        self.max_length = max_length
+        self.num_threads = num_threads
+        self.name = f'{model_name}::onnx-int8' if quantized else f'{model_name}::onnx'
+        self.session = None
+        self.tokenizer = None
+
+    def load(self):
+        if self.session is not None:
+            return self
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError:
+            raise ImportError('Для ONNX-кодировщика установите onnxruntime и transformers')
+
+        path = export_onnx(self.model_name, self.output_dir)
+        if self.quantized:
+            path = quantize_onnx(path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(self.output_dir)
+        return self
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        self.load()
+        texts = list(texts)
+        vectors = None
+        order = np.argsort([len(text) for text in texts])
+
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[row] for row in rows], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors='np'
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            if vectors is None:
+                vectors = np.zeros((len(texts), summed.shape[1]), dtype=np.float32)
+            vectors[rows] = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        return vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+
+
+def make_encoder(backend='torch', model_name=MODEL_NAME, **kwargs):
+    if backend == 'torch':
+        return SentenceTransformerEncoder(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name, quantized=False, **kwargs)
+    if backend == 'onnx-int8':
+        return OnnxEncoder(model_name, quantized=True, **kwargs)
+    if backend == 'hashing':
+        return HashingEncoder()
+    raise ValueError(f'Неизвестный кодировщик: {backend}, доступны: {", ".join(BACKENDS)}')
+
+
+def parity_report(reference, candidate, texts, processor=None, top_k=20, batch_size=32):
+    """Сравнивает кодировщик с эталонным: косинусный дрейф, пересечение top-k и скорость"""
+    start = time.perf_counter()
+    ref = np.asarray(reference.encode(texts, batch_size=batch_size), dtype=np.float32)
+    ref_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cand = np.asarray(candidate.encode(texts, batch_size=batch_size), dtype=np.float32)
+    cand_seconds = time.perf_counter() - start
+
+    norms = np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1)
+    cosines = (ref * cand).sum(axis=1) / np.where(norms == 0, 1.0, norms)
+    report = {
+        'texts': len(texts),
+        'cosine_mean': float(cosines.mean()),
+        'cosine_min': float(cosines.min()),
+        'cosine_p05': float(np.percentile(cosines, 5)),
+        'reference_texts_per_second': len(texts) / ref_seconds if ref_seconds else 0.0,
+        'candidate_texts_per_second': len(texts) / cand_seconds if cand_seconds else 0.0,
+        'speedup': ref_seconds / cand_seconds if cand_seconds else 0.0
+    }
+
+    if processor is not None and processor.index is not None:
+        overlaps = []
+        for ref_vec, cand_vec in zip(ref, cand):
+            ref_ids = set(processor.find_similar_by_vector(ref_vec, top_k)['index'])
+            cand_ids = set(processor.find_similar_by_vector(cand_vec, top_k)['index'])
+            overlaps.append(len(ref_ids & cand_ids) / max(len(ref_ids), 1))
+        report['top_k'] = top_k
+        report['top_k_overlap_mean'] = float(np.mean(overlaps))
+        report['top_k_overlap_min'] = float(np.min(overlaps))
+    return report
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from ann_index import normalize, top_k_desc
+
+COLUMNS = ('index', 'similarity', 'description', 'cluster')
+
+
+class FeedbackReranker:
+    """Переранжирование кандидатов по лайкам и дизлайкам без повторного поиска
+
+    Хранит вектор запроса и эмбеддинги пула кандидатов. После каждой оценки
+    запрос сдвигается по Роккио: q = alpha·q0 + beta·mean(лайки) − gamma·mean(дизлайки),
+    а оставшиеся кандидаты пересчитываются одним умножением (pool × d).
+    Новые кандидаты запрашиваются из индекса, только когда пул заканчивается.
+    """
+
+    def __init__(self, processor, query, top_k=20, pool_size=100, alpha=1.0, beta=0.75, gamma=0.25,
+                 min_pool=None, collapse=False):
+        self.processor = processor
+        self.top_k = top_k
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.min_pool = top_k if min_pool is None else min_pool
+        self.collapse = collapse
+        self.query0 = normalize(np.asarray(query).reshape(-1))
+        self.query = self.query0
+        self.liked_sum = np.zeros_like(self.query0)
+        self.disliked_sum = np.zeros_like(self.query0)
+        self.n_liked = 0
+        self.n_disliked = 0
+
+        dtypes = (processor.df.index.dtype, np.float32, object, np.int64)
+        self.shown = {column: np.empty(0, dtype=dtype) for column, dtype in zip(COLUMNS, dtypes)}
+        self.seen = set()
+        self.groups = set()
+        self.pool = {column: np.empty(0, dtype=dtype) for column, dtype in zip(COLUMNS, dtypes)}
+        self.vectors = np.empty((0, len(self.query0)), dtype=np.float32)
+        self.scores = np.empty(0, dtype=np.float32)
+        self.fetched = 0
+        self.nprobe = None
+        self.exhausted = False
+        self._fetch(pool_size)
+
+    def _fetch(self, n):
+        with self.processor.lock:
+            frame = self.processor.find_similar_by_vector(self.query, top_k=n, nprobe=self.nprobe,
+                                                          collapse=self.collapse)
+            n_lists = self.processor.index.n_lists
+            self.fetched = n
+            self.exhausted = len(frame) < n and self.nprobe == n_lists
+            self.nprobe = min(2 * (self.nprobe or self.processor.nprobe), n_lists)
+
+            frame = frame[~frame['index'].isin(self.seen) & ~frame['index'].isin(self.pool['index'])]
+            positions = self.processor.df.index.get_indexer(frame['index'])
+            frame, positions = frame[positions >= 0], positions[positions >= 0]
+            if self.collapse and 'dup_group' in self.processor.df.columns:
+                groups = self.processor.df['dup_group'].to_numpy()[positions]
+                fresh = ~pd.Series(groups).isin(self.groups).to_numpy()
+                frame, positions = frame[fresh], positions[fresh]
+                self.groups.update(groups[fresh].tolist())
+            if frame.empty:
+                return
+            vectors = normalize(self.processor.embeddings[positions])
+            frame = frame.assign(similarity=vectors @ self.query0)
+
+            for column in COLUMNS:
+                values = frame[column].to_numpy(dtype=self.pool[column].dtype)
+                self.pool[column] = np.concatenate([self.pool[column], values])
+            self.vectors = np.vstack([self.vectors, vectors])
+            self.scores = self.vectors @ self.query
+
+    def feedback(self, label, liked=None):
+        with self.processor.metrics.timer('feedback_rerank'):
+            matches = np.nonzero(self.pool['index'] == label)[0]
+            if len(matches) == 0:
+                return self.recommendations()
+            row = matches[0]
+
+            if liked is True:
+                self.liked_sum = self.liked_sum + self.vectors[row]
+                self.n_liked += 1
+            elif liked is False:
+                self.disliked_sum = self.disliked_sum + self.vectors[row]
+                self.n_disliked += 1
+
+            for column in COLUMNS:
+                self.shown[column] = np.append(self.shown[column], self.pool[column][row])
+            self.seen.add(label)
+            self.pool = {column: np.delete(values, row) for column, values in self.pool.items()}
+            self.vectors = np.delete(self.vectors, row, axis=0)
+
+            if liked is not None:
+                self.query = self._updated_query()
+            self.scores = self.vectors @ self.query
+
+            if len(self.vectors) < self.min_pool and not self.exhausted:
+                self._fetch(self.fetched * 2)
+            return self.recommendations()
+
+    def _updated_query(self):
+        query = self.alpha * self.query0
+        if self.n_liked:
+            query = query + self.beta * self.liked_sum / self.n_liked
+        if self.n_disliked:
+            query = query - self.gamma * self.disliked_sum / self.n_disliked
+        return normalize(query)
+
+    def recommendations(self):
+        """Просмотренные анкеты в порядке показа, затем лучшие из пула по текущему запросу"""
+        remaining = self.top_k - len(self.shown['index'])
+        order = np.empty(0, dtype=np.int64)
+        if remaining > 0 and len(self.vectors):
+            order = top_k_desc(self.scores, remaining)
+        
+        columns = {column: np.concatenate([self.shown[column], self.pool[column][order]]) for column in COLUMNS}
+        columns['score'] = np.concatenate([np.full(len(self.shown['index']), np.nan), self.scores[order]])
+        return pd.DataFrame(columns)
@@ -0,0 +1,205 @@
+import os
+import json
+import glob
+import numpy as np
+import pandas as pd
+
+from parallel_preprocess import PreprocessPool, preprocess_parallel
+import storage
+
+STATE_FILE = 'ingest_state.json'
+VECTORS_PART = 'embeddings.f32'
+PARTS_DIR = 'ingest_parts'
+TEXT_COLUMN = 'Описание'
+
+
+def _xlsx_chunks(path, chunk_size, column):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        position = list(header).index(column)
+        values = []
+        for row in rows:
+            values.append(row[position] if position < len(row) else None)
+            if len(values) == chunk_size:
+                yield pd.DataFrame({column: values})
+                values = []
+        if values:
+            yield pd.DataFrame({column: values})
+    finally:
+        workbook.close()
+
+
+def _parquet_chunks(path, chunk_size, column):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[column]):
+        yield batch.to_pandas()
+
+
+def iter_profile_chunks(path, chunk_size=10000, column=TEXT_COLUMN):
+    """Читает анкеты порциями: Excel (openpyxl read-only), CSV, JSONL или Parquet
+
+    Индекс каждой порции — номер строки в исходном файле, как у pd.read_excel.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        chunks = pd.read_csv(path, usecols=[column], chunksize=chunk_size)
+    elif extension in ('.jsonl', '.ndjson'):
+        chunks = pd.read_json(path, lines=True, chunksize=chunk_size)
+    elif extension == '.parquet':
+        chunks = _parquet_chunks(path, chunk_size, column)
+    else:
+        chunks = _xlsx_chunks(path, chunk_size, column)
+
+    start = 0
+    for chunk in chunks:
+        chunk = chunk[[column]]
+        chunk.index = np.arange(start, start + len(chunk), dtype=np.int64)
+        start += len(chunk)
+        yield chunk
+
+
+def _load_state(directory, fingerprint):
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('fingerprint') != fingerprint:
+        return None
+    return state
+
+
+def _save_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _reset(directory):
+    for path in glob.glob(os.path.join(directory, PARTS_DIR, '*.parquet')):
+        os.remove(path)
+    for name in (VECTORS_PART, STATE_FILE):
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+
+
+def _finalize(directory, state):
+    """Склеивает порции в profiles.parquet и embeddings.npy, не загружая их целиком в память"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parts = [os.path.join(directory, PARTS_DIR, f'part-{i:05d}.parquet') for i in range(state['chunks'])]
+    parts = [part for part in parts if os.path.exists(part)]
+    profiles_path = os.path.join(directory, storage.PROFILES_FILE)
+    writer = None
+    for part in parts:
+        table = pq.read_table(part)
+        if writer is None:
+            writer = pq.ParquetWriter(profiles_path + '.tmp', table.schema)
+        writer.write_table(table)
+    if writer is None:
+        empty = pd.DataFrame({TEXT_COLUMN: pd.Series(dtype=object), 'processed_text': pd.Series(dtype=object)})
+        pq.write_table(pa.Table.from_pandas(empty), profiles_path + '.tmp')
+    else:
+        writer.close()
+    os.replace(profiles_path + '.tmp', profiles_path)
+
+    rows, dim = state['rows_written'], state['dim'] or 0
+    embeddings_path = os.path.join(directory, storage.EMBEDDINGS_FILE)
+    target = np.lib.format.open_memmap(embeddings_path + '.tmp', mode='w+', dtype=np.float32, shape=(rows, dim))
+    if rows:
+        source = np.memmap(os.path.join(directory, VECTORS_PART), dtype=np.float32, mode='r', shape=(rows, dim))
+        step = max(1, state['chunk_size'])
+        for start in range(0, rows, step):
+            target[start:start + step] = source[start:start + step]
+        del source
+    target.flush()
+    del target
+    os.replace(embeddings_path + '.tmp', embeddings_path)
+
+
+def ingest_profiles(processor, source_path, directory, params=None, chunk_size=10000, batch_size=256,
+                    resume=True, progress=None):
+    """Потоковая загрузка анкет: чтение порциями → препроцессинг → кодирование → запись на диск
+
+    Векторы дописываются в сырой файл, таблица — в Parquet по порциям,
+    после каждой порции сохраняется состояние. Память ограничена размером
+    порции; при повторном запуске с resume=True обработка продолжается
+    с первой незаписанной порции. В конце порции склеиваются в формат storage.
+    """
+    os.makedirs(os.path.join(directory, PARTS_DIR), exist_ok=True)
+    fingerprint = dict(storage.source_fingerprint(source_path), **(params or {}))
+    state = _load_state(directory, fingerprint) if resume else None
+    if state is None or state['chunk_size'] != chunk_size:
+        _reset(directory)
+        os.makedirs(os.path.join(directory, PARTS_DIR), exist_ok=True)
+        state = {'fingerprint': fingerprint, 'chunk_size': chunk_size, 'chunks': 0, 'rows_read': 0,
+                 'rows_written': 0, 'dim': None, 'done': False}
+
+    if not state['done']:
+        processor.initialize_tools()
+        processor.load_lemma_cache()
+        processor.load_model()
+        cache = processor.load_embedding_cache()
+
+        vectors_path = os.path.join(directory, VECTORS_PART)
+        with open(vectors_path, 'ab') as f:
+            f.truncate(state['rows_written'] * (state['dim'] or 0) * 4)
+
+        pool = PreprocessPool(processor, processor.n_workers)
+        try:
+            for chunk_id, chunk in enumerate(iter_profile_chunks(source_path, chunk_size)):
+                if chunk_id < state['chunks']:
+                    continue
+                rows_read = len(chunk)
+                chunk = chunk.dropna(subset=[TEXT_COLUMN])
+                chunk = chunk[chunk[TEXT_COLUMN].astype(str).str.strip() != '']
+                chunk = chunk.assign(**{TEXT_COLUMN: chunk[TEXT_COLUMN].astype(str)})
+                chunk['processed_text'] = preprocess_parallel(processor, chunk[TEXT_COLUMN], pool=pool)
+
+                if len(chunk):
+                    vectors = cache.encode(chunk['processed_text'].tolist(), processor.model.encode, store=False,
+                                           batch_size=batch_size)
+                    state['dim'] = int(vectors.shape[1])
+                    with open(vectors_path, 'ab') as f:
+                        f.write(np.ascontiguousarray(vectors).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                    part_path = os.path.join(directory, PARTS_DIR, f'part-{chunk_id:05d}.parquet')
+                    chunk.to_parquet(part_path + '.tmp', index=True)
+                    os.replace(part_path + '.tmp', part_path)
+
+                state['chunks'] = chunk_id + 1
+                state['rows_read'] += rows_read
+                state['rows_written'] += len(chunk)
+                _save_state(directory, state)
+                processor.save_lemma_cache()
+                if progress is not None:
+                    progress(state)
+        finally:
+            pool.close()
+
+        _finalize(directory, state)
+        state['done'] = True
+        _save_state(directory, state)
+    return state
+
+
+def cleanup(directory):
+    """Удаляет промежуточные файлы потоковой загрузки после успешного сохранения"""
+    _reset(directory)
+    parts_dir = os.path.join(directory, PARTS_DIR)
+    if os.path.isdir(parts_dir) and not os.listdir(parts_dir):
+        os.rmdir(parts_dir)
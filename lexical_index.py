@@ -0,0 +1,89 @@
+import math
+from collections import Counter
+import numpy as np
+from ann_index import top_k_desc
+
+
+class BM25Index:
+    """Инвертированный индекс по лемматизированному тексту со скорингом BM25
+
+    Для каждого слова хранится список (метка анкеты → частота слова).
+    Метки — это индекс датафрейма, они не меняются при удалении других
+    анкет, поэтому индекс обновляется добавлением и удалением документов
+    без перестроения. Массивы NumPy для списков строятся при первом
+    запросе слова и сбрасываются, когда слово встречается в изменённой анкете.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+        self.arrays = {}
+
+    @classmethod
+    def build(cls, labels, texts, k1=1.5, b=0.75):
+        index = cls(k1=k1, b=b)
+        for label, text in zip(labels, texts):
+            index.add(label, text)
+        return index
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, label, text):
+        if label in self.doc_len:
+            self.remove(label)
+        terms = text.split()
+        self.doc_len[label] = len(terms)
+        self.total_len += len(terms)
+        for term, count in Counter(terms).items():
+            self.postings.setdefault(term, {})[label] = count
+            self.arrays.pop(term, None)
+
+    def remove(self, label, text=None):
+        length = self.doc_len.pop(label, None)
+        if length is None:
+            return
+        self.total_len -= length
+        terms = set(text.split()) if text is not None else [
+            term for term, posting in self.postings.items() if label in posting
+        ]
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None or posting.pop(label, None) is None:
+                continue
+            if not posting:
+                del self.postings[term]
+            self.arrays.pop(term, None)
+
+    def _posting_arrays(self, term):
+        arrays = self.arrays.get(term)
+        if arrays is None:
+            posting = self.postings[term]
+            labels = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+            tf = np.fromiter(posting.values(), dtype=np.float32, count=len(posting))
+            lengths = np.fromiter((self.doc_len[label] for label in posting), dtype=np.float32, count=len(posting))
+            arrays = self.arrays[term] = (labels, tf, lengths)
+        return arrays
+
+    def search(self, text, top_k=200):
+        terms = [term for term in dict.fromkeys(text.split()) if term in self.postings]
+        if not terms or not self.doc_len:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        n_docs = len(self.doc_len)
+        avg_len = self.total_len / n_docs if n_docs else 0.0
+        all_labels, all_scores = [], []
+        for term in terms:
+            labels, tf, lengths = self._posting_arrays(term)
+            idf = math.log(1.0 + (n_docs - len(labels) + 0.5) / (len(labels) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / max(avg_len, 1e-9))
+            all_labels.append(labels)
+            all_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+
+        labels, inverse = np.unique(np.concatenate(all_labels), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)).astype(np.float32)
+        order = top_k_desc(scores, top_k)
+        return labels[order], scores[order]
@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+from collections import deque, defaultdict
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'recent')
+
+    def __init__(self, window):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+
+class Metrics:
+    """Таймеры этапов, счётчики и гистограммы задержек с выгрузкой в формате Prometheus
+
+    В выключенном состоянии timer() возвращает общий пустой контекстный
+    менеджер, а inc() сразу выходит, так что накладные расходы минимальны.
+    Хуки вызываются как hook(stage, seconds) после каждого замера.
+    Коллекторы с метками (например, dataset) выгружаются отдельными
+    рядами, поэтому одинаковые имена из разных баз не перезаписываются.
+    """
+
+    def __init__(self, enabled=True, window=1000, prefix='friendfinder'):
+        self.enabled = enabled
+        self.window = window
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        self.hooks = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def add_collector(self, collector, labels=None):
+        self.collectors.append((collector, dict(labels or {})))
+
+    def remove_collector(self, collector):
+        self.collectors = [entry for entry in self.collectors if entry[0] != collector]
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = _Histogram(self.window)
+            histogram.count += 1
+            histogram.total += seconds
+            histogram.recent.append(seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram.buckets[i] += 1
+        for hook in self.hooks:
+            hook(stage, seconds)
+
+    def inc(self, event, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[event] += value
+
+    def gauge_series(self):
+        series = []
+        for collector, labels in list(self.collectors):
+            series += [(key, labels, value) for key, value in collector().items()]
+        return series
+
+    def gauges(self):
+        values = {}
+        for key, labels, value in self.gauge_series():
+            if labels:
+                key = ','.join(f'{label}={labels[label]}' for label in sorted(labels)) + ':' + key
+            values[key] = value
+        return values
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                recent = sorted(histogram.recent)
+                stages[stage] = {
+                    'count': histogram.count,
+                    'mean_ms': histogram.total / histogram.count * 1000 if histogram.count else 0.0,
+                    'p50_ms': recent[int(0.50 * (len(recent) - 1))] * 1000 if recent else 0.0,
+                    'p95_ms': recent[int(0.95 * (len(recent) - 1))] * 1000 if recent else 0.0,
+                    'p99_ms': recent[int(0.99 * (len(recent) - 1))] * 1000 if recent else 0.0
+                }
+            counters = dict(self.counters)
+        return {'stages': stages, 'counters': counters, 'gauges': self.gauges()}
+
+    def to_prometheus(self):
+        name = f'{self.prefix}_stage_seconds'
+        lines = [f'# HELP {name} Latency of processing stages.', f'# TYPE {name} histogram']
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            counters = dict(self.counters)
+
+        name = f'{self.prefix}_events_total'
+        lines += [f'# HELP {name} Counted events.', f'# TYPE {name} counter']
+        for event, value in sorted(counters.items()):
+            lines.append(f'{name}{{event="{event}"}} {value}')
+
+        series = self.gauge_series()
+        if series:
+            name = f'{self.prefix}_gauge'
+            lines += [f'# HELP {name} Current values (cache sizes and hit rates).', f'# TYPE {name} gauge']
+            for key, labels, value in sorted(series, key=lambda item: (item[0], sorted(item[1].items()))):
+                extra = ''.join(f',{label}="{labels[label]}"' for label in sorted(labels))
+                lines.append(f'{name}{{name="{key}"{extra}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(path + '.tmp', path)
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """Запускает HTTP-эндпоинт /metrics в фоновом потоке"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,58 @@
+import re
+
+# Список русских стоп-слов NLTK (stopwords.words('russian')), встроен, чтобы не скачивать его при запуске
+NLTK_RUSSIAN_STOP_WORDS = frozenset((
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его',
+    'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от',
+    'меня', 'еще', 'нет', 'о', 'из', 'ему', 'теперь', 'когда', 'даже', 'ну', 'вдруг', 'ли', 'если', 'уже',
+    'или', 'ни', 'быть', 'был', 'него', 'до', 'вас', 'нибудь', 'опять', 'уж', 'вам', 'ведь', 'там', 'потом',
+    'себя', 'ничего', 'ей', 'может', 'они', 'тут', 'где', 'есть', 'надо', 'ней', 'для', 'мы', 'тебя', 'их',
+    'чем', 'была', 'сам', 'чтоб', 'без', 'будто', 'чего', 'раз', 'тоже', 'себе', 'под', 'будет', 'ж', 'тогда',
+    'кто', 'этот', 'того', 'потому', 'этого', 'какой', 'совсем', 'ним', 'здесь', 'этом', 'один', 'почти',
+    'мой', 'тем', 'чтобы', 'нее', 'сейчас', 'были', 'куда', 'зачем', 'всех', 'никогда', 'можно', 'при',
+    'наконец', 'два', 'об', 'другой', 'хоть', 'после', 'над', 'больше', 'тот', 'через', 'эти', 'нас', 'про',
+    'всего', 'них', 'какая', 'много', 'разве', 'три', 'эту', 'моя', 'впрочем', 'хорошо', 'свою', 'этой',
+    'перед', 'иногда', 'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 'более', 'всегда', 'конечно', 'всю',
+    'между'
+))
+
+CUSTOM_STOP_WORDS = frozenset((
+    'привет', 'меня', 'звать', 'здравствуйте', 'приветик', 'здарова', 'хай',
+    'это', 'вот', 'ну', 'да', 'нет', 'так', 'еще', 'уже', 'просто', 'очень',
+    'свой', 'моя', 'мой', 'мое', 'работаю', 'работать', 'своя', 'свои', 'своей',
+    'свою', 'своих', 'который', 'которая', 'которые', 'которым', 'которыми',
+    'любить', 'нравится', 'хотеть', 'уметь', 'слушать', 'искать', 'заниматься',
+    'смотреть', 'обожать', 'девушка', 'парень', 'человек', 'фильм', 'музыка',
+    'здорово', 'фанат', 'работа', 'жизнь', 'реалистичный',
+    'мужчина', 'увлекаться', 'любимый', 'изучать', 'хобби', 'женщина',
+    'мечтать', 'весь', 'создавать', 'коллекционировать', 'специалист', 'время',
+    'помогать', 'сериал', 'создание', 'классический', 'система', 'свободный', 'умный',
+    'звук', 'городской', 'ценить', 'искусство', 'история', 'исторический', 'оценить',
+    'разрабатывать', 'старинный', 'ребёнок', 'редкий', 'разный', 'музей',
+    'мастер', 'древний', 'традиционный', 'возвращать', 'красота', 'встреча',
+    'коллекциониий', 'коллекционирование', 'изучение', 'год'
+))
+
+STOP_WORDS = NLTK_RUSSIAN_STOP_WORDS | CUSTOM_STOP_WORDS
+
+# Слово — непрерывная последовательность строчных русских букв. Это то же самое,
+# что замена остальных символов на пробелы, схлопывание пробелов и word_tokenize,
+# который на тексте только из букв и пробелов делит его по пробелам.
+_WORD = re.compile(r'[а-яё]+')
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def normalize(text, lemmatize, stop_words=STOP_WORDS, min_length=3):
+    """Токенизация, фильтр стоп-слов и коротких слов до и после лемматизации"""
+    if not isinstance(text, str):
+        return ''
+    cleaned = []
+    for token in tokenize(text):
+        if token not in stop_words and len(token) >= min_length:
+            lemma = lemmatize(token)
+            if lemma not in stop_words and len(lemma) >= min_length:
+                cleaned.append(lemma)
+    return ' '.join(cleaned)
@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_worker = None
+_known_lemmas = None
+
+
+def _init_worker(lemma_cache_size, lemma_items):
+    global _worker, _known_lemmas
+    from bert_processor import BERTProcessor
+
+    _worker = BERTProcessor(lemma_cache_size=lemma_cache_size)
+    _worker.initialize_tools()
+    for token, lemma in lemma_items:
+        _worker.lemma_cache.put(token, lemma)
+    _known_lemmas = {token for token, _ in lemma_items}
+
+
+def _process_chunk(texts):
+    results = [_worker.preprocess_text(text) for text in texts]
+    new_lemmas = [(token, lemma) for token, lemma in _worker.lemma_cache.items() if token not in _known_lemmas]
+    _known_lemmas.update(token for token, _ in new_lemmas)
+    return results, new_lemmas
+
+
+class PreprocessPool:
+    """Пул процессов препроцессинга, общий для нескольких вызовов preprocess_parallel
+
+    Процессы запускаются при первом map() и живут до close(), поэтому
+    pymorphy2 и стоп-слова инициализируются один раз на всю потоковую
+    загрузку, а не на каждую порцию.
+    """
+
+    def __init__(self, processor, n_workers=None):
+        self.processor = processor
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.executor = None
+
+    @property
+    def started(self):
+        return self.executor is not None
+
+    def map(self, texts, chunk_size=2000):
+        texts = list(texts)
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        if self.executor is None:
+            initargs = (self.processor.lemma_cache.maxsize, self.processor.lemma_cache.items())
+            self.executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker, initargs=initargs)
+
+        results = []
+        for chunk_results, new_lemmas in self.executor.map(_process_chunk, chunks):
+            results.extend(chunk_results)
+            for token, lemma in new_lemmas:
+                self.processor.lemma_cache.put(token, lemma)
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def preprocess_parallel(processor, texts, n_workers=None, chunk_size=2000, min_rows=10000, pool=None):
+    """Препроцессинг текстов в пуле процессов с сохранением порядка
+
+    Каждый процесс один раз инициализирует pymorphy2 и стоп-слова и
+    получает копию уже накопленного кэша лемм; новые леммы из процессов
+    возвращаются в кэш основного процессора. На малых объёмах и при
+    n_workers=1 работает последовательно. С pool используется переданный
+    PreprocessPool; после его запуска порог min_rows не применяется.
+    """
+    texts = list(texts)
+    n_workers = pool.n_workers if pool is not None else n_workers or os.cpu_count() or 1
+    if n_workers <= 1 or not texts or (len(texts) < min_rows and (pool is None or not pool.started)):
+        return [processor.preprocess_text(text) for text in texts]
+    if pool is not None:
+        return pool.map(texts, chunk_size)
+
+    n_chunks = (len(texts) + chunk_size - 1) // chunk_size
+    with PreprocessPool(processor, min(n_workers, n_chunks)) as pool:
+        return pool.map(texts, chunk_size)
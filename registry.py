@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+
+from bert_processor import BERTProcessor, DATA_DIR, DEFAULT_N_CLUSTERS
+from caches import LRUCache
+from encoders import make_encoder
+from metrics import Metrics
+
+DATASETS_DIR = os.path.join(DATA_DIR, 'datasets')
+
+
+class ProcessorRegistry:
+    """Несколько баз анкет в одном процессе с общим кодировщиком и бюджетом памяти
+
+    У каждой базы свой BERTProcessor (таблица, эмбеддинги, KMeans, индекс)
+    и своя папка с обработанными данными; кодировщик, pymorphy2 и кэш лемм
+    общие. База загружается при первом обращении. Если суммарный объём
+    загруженных баз превышает memory_budget_mb, выгружаются давно не
+    использованные; при следующем обращении база снова читается с диска.
+    Поиск, начатый до выгрузки, завершается на старом объекте.
+    """
+
+    def __init__(self, encoder=None, memory_budget_mb=4096, root_dir=DATASETS_DIR, metrics=None,
+                 lemma_cache_size=200000, **processor_options):
+        self.encoder = encoder if encoder is not None else make_encoder('torch')
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.root_dir = root_dir
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.metrics.add_collector(self._gauges)
+        self.processor_options = processor_options
+        self.lemma_cache = LRUCache(lemma_cache_size)
+        self.morph = None
+        self.datasets = OrderedDict()
+        self.loaded = OrderedDict()
+        self.sizes = {}
+        self.loading_locks = {}
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self.encoder_lock = threading.Lock()
+
+    def register(self, name, source_path, n_clusters=DEFAULT_N_CLUSTERS, data_dir=None, streaming=False,
+                 **processor_options):
+        with self.lock:
+            self.datasets[name] = {
+                'source_path': source_path,
+                'data_dir': data_dir or os.path.join(self.root_dir, name),
+                'n_clusters': n_clusters,
+                'streaming': streaming,
+                'options': processor_options
+            }
+            self.loading_locks.setdefault(name, threading.Lock())
+        return self
+
+    def __contains__(self, name):
+        return name in self.datasets
+
+    def names(self):
+        return list(self.datasets)
+
+    @property
+    def default(self):
+        return next(iter(self.datasets), None)
+
+    def _touch(self, name):
+        processor = self.loaded.get(name)
+        if processor is not None:
+            self.loaded.move_to_end(name)
+        return processor
+
+    def get(self, name):
+        """Процессор базы; незагруженная база читается с диска (или обрабатывается заново)"""
+        with self.lock:
+            processor = self._touch(name)
+            if processor is not None:
+                self.metrics.inc('registry_hits')
+                return processor
+            if name not in self.datasets:
+                raise KeyError(f'Неизвестная база анкет: {name}')
+            spec = self.datasets[name]
+            loading_lock = self.loading_locks[name]
+
+        with loading_lock:
+            with self.lock:
+                processor = self._touch(name)
+            if processor is not None:
+                return processor
+            processor = self._load(name, spec)
+            size = processor.memory_usage()
+            with self.lock:
+                self.loaded[name] = processor
+                self.sizes[name] = size
+                self.loads += 1
+                self._evict(keep=name)
+        return processor
+
+    def _load(self, name, spec):
+        with self.encoder_lock:
+            self.encoder.load()
+        options = dict(self.processor_options, **spec['options'])
+        processor = BERTProcessor(data_dir=spec['data_dir'], encoder=self.encoder, metrics=self.metrics,
+                                  metrics_labels={'dataset': name}, **options)
+        processor.lemma_cache = self.lemma_cache
+        processor.morph = self.morph
+        os.makedirs(spec['data_dir'], exist_ok=True)
+        with self.metrics.timer('registry_load'):
+            processor.load_and_process_data(spec['source_path'], spec['n_clusters'], streaming=spec['streaming'])
+        with self.lock:
+            if self.morph is None:
+                self.morph = processor.morph
+        return processor
+
+    def _evict(self, keep=None):
+        while sum(self.sizes.values()) > self.memory_budget:
+            name = next((candidate for candidate in self.loaded if candidate != keep), None)
+            if name is None:
+                break
+            self.unload(name)
+
+    def unload(self, name):
+        with self.lock:
+            processor = self.loaded.pop(name, None)
+            self.sizes.pop(name, None)
+            if processor is None:
+                return False
+            self.evictions += 1
+        self.metrics.inc('registry_evictions')
+        processor.close()
+        return True
+
+    def memory_usage(self):
+        with self.lock:
+            return sum(self.sizes.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'memory_used_bytes': sum(self.sizes.values()),
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'datasets': {
+                    name: {
+                        'loaded': name in self.loaded,
+                        'memory_bytes': self.sizes.get(name, 0),
+                        'profiles': len(self.loaded[name].df) if name in self.loaded else None
+                    }
+                    for name in self.datasets
+                }
+            }
+
+    def _gauges(self):
+        with self.lock:
+            return {
+                'registry_memory_bytes': sum(self.sizes.values()),
+                'registry_memory_budget_bytes': self.memory_budget,
+                'registry_loaded_datasets': len(self.loaded)
+            }
+
+    def find_similar_profiles(self, name, user_text, top_k=20, nprobe=None, mode=None, collapse=False):
+        return self.get(name).find_similar_profiles(user_text, top_k, nprobe, mode, collapse)
+
+    def predict_cluster_for_text(self, name, text):
+        return self.get(name).predict_cluster_for_text(text)
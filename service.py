@@ -0,0 +1,329 @@
+import os
+import json
+import asyncio
+import functools
+import argparse
+
+from bert_processor import BERTProcessor, DATA_DIR
+from encoders import make_encoder, BACKENDS
+from metrics import Metrics
+from registry import ProcessorRegistry
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class MicroBatcher:
+    """Объединяет одновременные запросы в один вызов кодировщика
+
+    Первый запрос в очереди открывает окно ожидания max_wait_ms; всё, что
+    пришло за это время (но не больше max_batch_size), кодируется одним
+    батчем. Если в очереди уже max_queue запросов, новые отклоняются.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=5.0, max_queue=1024):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def submit(self, item):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.encode_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue': self.max_queue,
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'rejected': self.rejected
+        }
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class MatchingService:
+    """ASGI-приложение поверх BERTProcessor: /predict, /similar, /health, /stats, /metrics
+
+    Вместо одного процессора можно передать ProcessorRegistry: тогда база
+    выбирается полем "dataset" в запросе (по умолчанию — первая
+    зарегистрированная), а у каждой базы своя очередь батчинга.
+    """
+
+    def __init__(self, processor=None, max_batch_size=64, max_wait_ms=5.0, max_queue=1024, registry=None):
+        if (processor is None) == (registry is None):
+            raise ValueError('Нужен либо processor, либо registry')
+        self.processor = processor
+        self.registry = registry
+        self.batcher_options = (max_batch_size, max_wait_ms, max_queue)
+        self.batchers = {}
+        self.metrics = processor.metrics if registry is None else registry.metrics
+
+    def _dataset(self, dataset):
+        if self.registry is None:
+            return None
+        dataset = dataset or self.registry.default
+        if dataset not in self.registry:
+            raise ValueError(f'Неизвестная база анкет: {dataset}')
+        return dataset
+
+    def _batcher(self, dataset):
+        batcher = self.batchers.get(dataset)
+        if batcher is None:
+            if self.registry is None:
+                encode_fn = self.processor.encode_queries
+            else:
+                encode_fn = lambda items: self.registry.get(dataset).encode_queries(items)
+            batcher = self.batchers[dataset] = MicroBatcher(encode_fn, *self.batcher_options)
+        return batcher
+
+    async def _in_executor(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def _processor(self, dataset):
+        if self.registry is None:
+            return self.processor
+        return await self._in_executor(self.registry.get, dataset)
+
+    async def predict(self, text, dataset=None):
+        dataset = self._dataset(dataset)
+        processor = await self._processor(dataset)
+        processed = await self._in_executor(processor.preprocess_text, text)
+        if not processed:
+            return {'cluster': -1, 'confidence': 0.0, 'error': 'Пустой текст'}
+        entry = await self._batcher(dataset).submit(processed)
+        return await self._in_executor(processor.cluster_result, processed, entry['cluster'], entry['distance'])
+
+    async def similar(self, text, top_k=20, nprobe=None, mode=None, collapse=False, dataset=None):
+        dataset = self._dataset(dataset)
+        processor = await self._processor(dataset)
+        processed = await self._in_executor(processor.preprocess_text, text)
+        if not processed:
+            return []
+        entry = await self._batcher(dataset).submit(processed)
+
+        def search():
+            results = processor.find_similar_by_vector(
+                entry['embedding'], top_k, nprobe, mode, text=processed, collapse=collapse
+            )
+            return results.to_dict('records')
+        return await self._in_executor(search)
+
+    def health(self):
+        if self.registry is None:
+            return {'status': 'ok', 'profiles': len(self.processor.df)}
+        return {'status': 'ok', 'datasets': self.registry.names()}
+
+    def stats(self):
+        batchers = {name: batcher.stats() for name, batcher in self.batchers.items()}
+        if self.registry is None:
+            return {'batcher': self._batcher(None).stats(), 'caches': self.processor.get_cache_stats()}
+        return {'batchers': batchers, 'registry': self.registry.stats()}
+
+    async def _read_json(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        payload = json.loads(body or b'{}')
+        if not isinstance(payload, dict) or not isinstance(payload.get('text'), str):
+            raise ValueError('Ожидается JSON с полем "text"')
+        return payload
+
+    async def _respond(self, send, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False, default=_json_default).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json; charset=utf-8')] + list(headers)
+        })
+        await send({'type': 'http.response.body', 'body': data})
+
+    async def _respond_text(self, send, text):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')]
+        })
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.registry is None:
+                    self._batcher(None).start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for batcher in self.batchers.values():
+                    await batcher.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        route = (scope['method'], scope['path'])
+        headers = ()
+        try:
+            if route == ('GET', '/health'):
+                status, body = 200, self.health()
+            elif route == ('GET', '/metrics'):
+                await self._respond_text(send, self.metrics.to_prometheus())
+                return
+            elif route == ('GET', '/stats'):
+                status, body = 200, self.stats()
+            elif route == ('POST', '/predict'):
+                payload = await self._read_json(receive)
+                status, body = 200, await self.predict(payload['text'], payload.get('dataset'))
+            elif route == ('POST', '/similar'):
+                payload = await self._read_json(receive)
+                top_k = int(payload.get('top_k', 20))
+                if top_k < 1:
+                    raise ValueError('top_k должен быть положительным')
+                nprobe = payload.get('nprobe')
+                if nprobe is not None and int(nprobe) < 1:
+                    raise ValueError('nprobe должен быть положительным')
+                mode = payload.get('mode')
+                if mode not in (None, 'ivf', 'exact', 'hybrid'):
+                    raise ValueError('mode должен быть "ivf", "exact" или "hybrid"')
+                status, body = 200, await self.similar(
+                    payload['text'], top_k, None if nprobe is None else int(nprobe), mode,
+                    bool(payload.get('collapse', False)), payload.get('dataset')
+                )
+            else:
+                status, body = 404, {'error': 'Не найдено'}
+        except QueueFullError:
+            status, body = 503, {'error': 'Сервис перегружен, повторите запрос позже'}
+            headers = [(b'retry-after', b'1')]
+        except (ValueError, TypeError) as e:
+            status, body = 400, {'error': str(e)}
+
+        await self._respond(send, status, body, headers)
+
+
+def create_app(excel_path='base_doc.xlsx', data_dir=DATA_DIR, stub_encoder=False, encoder_backend='torch',
+               datasets=None, memory_budget_mb=4096, **batcher_options):
+    encoder = make_encoder('hashing' if stub_encoder else encoder_backend)
+    if datasets:
+        registry = ProcessorRegistry(encoder=encoder, memory_budget_mb=memory_budget_mb,
+                                     root_dir=os.path.join(data_dir, 'datasets'), metrics=Metrics())
+        for name, path in datasets.items():
+            registry.register(name, path)
+        return MatchingService(registry=registry, **batcher_options)
+    processor = BERTProcessor(data_dir=data_dir, encoder=encoder, metrics=Metrics())
+    processor.load_and_process_data(excel_path)
+    return MatchingService(processor, **batcher_options)
+
+
+def parse_dataset(value):
+    name, sep, path = value.partition('=')
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError('Ожидается имя=путь, например moscow=moscow.xlsx')
+    return name, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP-сервис подбора анкет с динамическим батчингом')
+    parser.add_argument('--excel-path', default='base_doc.xlsx')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-queue', type=int, default=1024)
+    parser.add_argument('--encoder', choices=BACKENDS, default='torch')
+    parser.add_argument('--stub-encoder', action='store_true', help='Кодировщик без весов модели (для локальной проверки)')
+    parser.add_argument('--dataset', type=parse_dataset, action='append', default=[],
+                        help='База анкет имя=путь (можно несколько); база выбирается полем "dataset" в запросе')
+    parser.add_argument('--memory-budget-mb', type=float, default=4096,
+                        help='Бюджет памяти на загруженные базы; давно не использованные выгружаются')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit('Для запуска сервиса установите uvicorn: pip install uvicorn')
+
+    app = create_app(
+        args.excel_path, args.data_dir, args.stub_encoder, args.encoder,
+        dict(args.dataset), args.memory_budget_mb, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, max_queue=args.max_queue
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
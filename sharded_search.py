@@ -0,0 +1,73 @@
+import os
+import heapq
+from itertools import islice
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from ann_index import normalize, top_k_desc
+
+
+class ShardedSearcher:
+    """Точный поиск по косинусу, распараллеленный по непрерывным шардам матрицы эмбеддингов
+
+    Шарды — это срезы исходного массива (без копирования, в том числе для
+    np.memmap). Каждый поток считает скалярные произведения своего шарда
+    и локальный top-k; NumPy отпускает GIL на умножении матриц, поэтому
+    шарды обрабатываются параллельно. Локальные списки сливаются кучей.
+    """
+
+    def __init__(self, embeddings, n_shards=None, n_workers=None):
+        self.embeddings = embeddings
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.n_shards = max(1, min(n_shards or self.n_workers, len(embeddings)))
+        bounds = np.linspace(0, len(embeddings), self.n_shards + 1).astype(np.int64)
+        self.shards = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            norms = np.linalg.norm(np.asarray(embeddings[start:stop], dtype=np.float32), axis=1)
+            norms[norms == 0] = 1.0
+            self.shards.append((int(start), int(stop), (1.0 / norms).astype(np.float32)))
+        self.executor = ThreadPoolExecutor(max_workers=self.n_workers) if self.n_shards > 1 else None
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def _search_shard(self, shard, unit_queries, top_k):
+        start, stop, inv_norms = shard
+        scores = (unit_queries @ np.asarray(self.embeddings[start:stop], dtype=np.float32).T) * inv_norms
+        results = []
+        for row in scores:
+            best = top_k_desc(row, top_k)
+            results.append(list(zip(row[best].tolist(), (best + start).tolist())))
+        return results
+
+    def _map(self, unit_queries, top_k):
+        executor = self.executor
+        if executor is not None:
+            try:
+                futures = [executor.submit(self._search_shard, shard, unit_queries, top_k) for shard in self.shards]
+            except RuntimeError:
+                # пул закрыт (база выгружена), пока шёл поиск — досчитываем в текущем потоке
+                futures = None
+            if futures is not None:
+                return [future.result() for future in futures]
+        return [self._search_shard(shard, unit_queries, top_k) for shard in self.shards]
+
+    def search_batch(self, queries, top_k=20):
+        unit_queries = normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.embeddings.shape[1]))
+        per_shard = self._map(unit_queries, top_k)
+
+        results = []
+        for row in range(len(unit_queries)):
+            candidates = heapq.merge(*(shard[row] for shard in per_shard), key=lambda item: item[0], reverse=True)
+            merged = list(islice(candidates, top_k))
+            ids = np.fromiter((item[1] for item in merged), dtype=np.int64, count=len(merged))
+            scores = np.fromiter((item[0] for item in merged), dtype=np.float32, count=len(merged))
+            results.append((ids, scores))
+        return results
+
+    def search(self, query, top_k=20):
+        return self.search_batch(query, top_k)[0]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -0,0 +1,81 @@
+import numpy as np
+
+CHUNK_SIZE = 65536
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SimilarityStats:
+    """Средняя попарная косинусная схожесть за O(N·d) без матрицы N×N
+
+    Сумма u_i·u_j по всем парам i<j равна (||Σu||² - Σ||u||²) / 2,
+    поэтому достаточно хранить сумму нормированных векторов.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum_vector = None
+        self.sum_sq_norms = 0.0
+
+    @classmethod
+    def from_embeddings(cls, embeddings):
+        stats = cls()
+        stats.add(embeddings)
+        return stats
+
+    def _accumulate(self, vectors, sign):
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        for start in range(0, len(vectors), CHUNK_SIZE):
+            unit = normalize_rows(vectors[start:start + CHUNK_SIZE])
+            if self.sum_vector is None:
+                self.sum_vector = np.zeros(unit.shape[1], dtype=np.float64)
+            self.sum_vector += sign * unit.sum(axis=0)
+            self.sum_sq_norms += sign * float(np.einsum('ij,ij->', unit, unit))
+            self.count += sign * len(unit)
+
+    def add(self, vectors):
+        self._accumulate(vectors, 1)
+
+    def remove(self, vectors):
+        self._accumulate(vectors, -1)
+
+    @property
+    def mean_pairwise(self):
+        if self.count < 2:
+            return 0.0
+        pair_sum = float(self.sum_vector @ self.sum_vector) - self.sum_sq_norms
+        return pair_sum / (self.count * (self.count - 1))
+
+
+def sample_similarity_distribution(embeddings, n_pairs=10000, bins=20, random_state=42):
+    """Оценивает распределение попарной схожести по случайной выборке пар"""
+    n = len(embeddings)
+    if n < 2:
+        return {'pairs': 0, 'mean': 0.0, 'percentiles': {}, 'histogram': ([], [])}
+
+    rng = np.random.default_rng(random_state)
+    left = rng.integers(0, n, size=n_pairs)
+    right = rng.integers(0, n - 1, size=n_pairs)
+    right[right >= left] += 1
+
+    sims = np.empty(n_pairs, dtype=np.float64)
+    for start in range(0, n_pairs, CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        a = normalize_rows(embeddings[left[start:stop]])
+        b = normalize_rows(embeddings[right[start:stop]])
+        sims[start:stop] = np.einsum('ij,ij->i', a, b)
+
+    counts, edges = np.histogram(sims, bins=bins, range=(-1.0, 1.0))
+    return {
+        'pairs': n_pairs,
+        'mean': float(sims.mean()),
+        'percentiles': {p: float(np.percentile(sims, p)) for p in (5, 25, 50, 75, 95)},
+        'histogram': (counts.tolist(), edges.tolist())
+    }
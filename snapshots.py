@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import Future
+
+import storage
+from bert_processor import BERTProcessor, DATA_DIR, DEFAULT_N_CLUSTERS
+from caches import LRUCache
+from encoders import make_encoder, BACKENDS
+from metrics import Metrics
+
+SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'snapshots')
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+BUILD_PREFIX = '.build-'
+CARRIED_CACHES = ('embedding_cache.npz', 'lemma_cache.json')
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class Snapshot:
+    """Подключённая версия данных: процессор только для чтения и манифест версии"""
+
+    def __init__(self, version, processor, manifest):
+        self.version = version
+        self.processor = processor
+        self.manifest = manifest
+
+
+class SnapshotManager:
+    """Версии обработанных данных с фоновой пересборкой и атомарной подменой
+
+    Каждая версия — неизменяемая папка vNNNNNN с таблицей, эмбеддингами,
+    KMeans, индексом и статистикой. Новая версия собирается во временной
+    папке, переименовывается и загружается, после чего current подменяется
+    одним присваиванием, а указатель CURRENT на диске — через os.replace.
+    Поиск, начатый на старой версии, дорабатывает на ней: её процессор
+    не изменяется. Хранится keep последних версий (и всегда текущая);
+    rollback() подключает предыдущую. Номер версии занимается через
+    os.mkdir, поэтому сборка из CLI не столкнётся со сборкой в приложении.
+    Подключённые версии открываются только для чтения: переобучение
+    в папку версии не пишется, а правки анкет попадают в общий журнал
+    root_dir/changes.jsonl, который применяется при сборке и подключении
+    каждой следующей версии.
+    """
+
+    def __init__(self, root_dir=SNAPSHOTS_DIR, keep=3, encoder=None, metrics=None, lemma_cache_size=200000,
+                 **processor_options):
+        self.root_dir = root_dir
+        self.keep = max(1, keep)
+        self.encoder = encoder if encoder is not None else make_encoder('torch')
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.processor_options = processor_options
+        self.lemma_cache = LRUCache(lemma_cache_size)
+        self.morph = None
+        self.current = None
+        self.builder = None
+        self.task = None
+        self.failed_source = None
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+
+    @property
+    def processor(self):
+        current = self.current
+        return current.processor if current is not None else None
+
+    @property
+    def version(self):
+        current = self.current
+        return current.version if current is not None else None
+
+    @property
+    def status(self):
+        builder = self.builder
+        if builder is not None:
+            return builder.status
+        return 'ready' if self.current is not None else 'idle'
+
+    @property
+    def busy(self):
+        task = self.task
+        return task is not None and not task.done()
+
+    def versions(self):
+        if not os.path.isdir(self.root_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root_dir)
+            if name.startswith('v') and os.path.exists(os.path.join(self.root_dir, name, MANIFEST_FILE))
+        )
+
+    def pointer(self):
+        """Версия, записанная в CURRENT (её мог переключить и другой процесс)"""
+        try:
+            with open(os.path.join(self.root_dir, CURRENT_FILE), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def manifest(self, version):
+        with open(os.path.join(self.root_dir, version, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_pointer(self, version):
+        path = os.path.join(self.root_dir, CURRENT_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(path + '.tmp', path)
+
+    def _new_processor(self, data_dir, version, read_only=False):
+        options = dict(self.processor_options, auto_refit=False, read_only=read_only, changes_dir=self.root_dir)
+        processor = BERTProcessor(data_dir=data_dir, encoder=self.encoder, metrics=self.metrics,
+                                  metrics_labels={'snapshot': version}, **options)
+        processor.lemma_cache = self.lemma_cache
+        processor.morph = self.morph
+        return processor
+
+    def _share_tools(self, processor):
+        with self.lock:
+            if self.morph is None:
+                self.morph = processor.morph
+
+    def _reserve_version(self):
+        os.makedirs(self.root_dir, exist_ok=True)
+        while True:
+            numbers = [int(name[1:]) for name in os.listdir(self.root_dir) if name[:1] == 'v' and name[1:].isdigit()]
+            version = f'v{max(numbers, default=0) + 1:06d}'
+            try:
+                os.mkdir(os.path.join(self.root_dir, version))
+                return version
+            except FileExistsError:
+                continue
+
+    def build(self, source_path, n_clusters=DEFAULT_N_CLUSTERS):
+        """Собирает новую версию из исходного файла, не трогая текущую; возвращает имя версии
+
+        Кэши эмбеддингов и лемм копируются из текущей версии (или из
+        processed_data/), поэтому заново кодируются только изменённые анкеты.
+        """
+        with self.build_lock:
+            version = self._reserve_version()
+            build_dir = os.path.join(self.root_dir, BUILD_PREFIX + version)
+            shutil.rmtree(build_dir, ignore_errors=True)
+            os.makedirs(build_dir)
+            cache_dir = self.processor.data_dir if self.current is not None else os.path.dirname(self.root_dir)
+            for name in CARRIED_CACHES:
+                if os.path.exists(os.path.join(cache_dir, name)):
+                    shutil.copy2(os.path.join(cache_dir, name), os.path.join(build_dir, name))
+
+            processor = self.builder = self._new_processor(build_dir, version)
+            try:
+                with self.metrics.timer('snapshot_build'):
+                    processor.load_and_process_data(source_path, n_clusters)
+                manifest = {
+                    'version': version,
+                    'created_at': time.time(),
+                    'source': storage.source_fingerprint(source_path),
+                    'params': processor._storage_params(),
+                    'stats': processor.get_dataset_stats()
+                }
+                with open(os.path.join(build_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(_jsonable(manifest), f, ensure_ascii=False, indent=2)
+                os.replace(build_dir, os.path.join(self.root_dir, version))
+            except BaseException:
+                shutil.rmtree(build_dir, ignore_errors=True)
+                shutil.rmtree(os.path.join(self.root_dir, version), ignore_errors=True)
+                raise
+            finally:
+                self.builder = None
+                processor.close()
+            self._share_tools(processor)
+            return version
+
+    def activate(self, version):
+        """Загружает версию с диска и атомарно делает её текущей"""
+        processor = self._new_processor(os.path.join(self.root_dir, version), version, read_only=True)
+        with self.metrics.timer('snapshot_load'):
+            processor.load_processed_data()
+        snapshot = Snapshot(version, processor, self.manifest(version))
+        self._share_tools(processor)
+        with self.lock:
+            previous, self.current = self.current, snapshot
+            self._write_pointer(version)
+        self.metrics.inc('snapshot_swaps')
+        if previous is not None:
+            previous.processor.close()
+        self.apply_retention()
+        return snapshot
+
+    def previous_version(self):
+        current = self.version or self.pointer()
+        older = [version for version in self.versions() if current is None or version < current]
+        if not older:
+            raise ValueError('Нет предыдущей версии для отката')
+        return older[-1]
+
+    def rollback(self):
+        """Подключает версию, предшествующую текущей"""
+        return self.activate(self.previous_version())
+
+    def point_to(self, version):
+        """Переключает CURRENT без загрузки; запущенные приложения подхватят версию через sync()"""
+        if version not in self.versions():
+            raise ValueError(f'Нет версии {version}')
+        with self.lock:
+            self._write_pointer(version)
+        self.apply_retention()
+        return version
+
+    def apply_retention(self):
+        """Удаляет старые версии сверх keep; текущая версия не удаляется никогда"""
+        with self.lock:
+            keep = set(self.versions()[-self.keep:])
+            keep.update(version for version in (self.version, self.pointer()) if version)
+        removed = []
+        for version in self.versions():
+            if version not in keep:
+                shutil.rmtree(os.path.join(self.root_dir, version), ignore_errors=True)
+                removed.append(version)
+        return removed
+
+    def is_stale(self, source_path):
+        """Исходный файл изменился после сборки самой новой версии"""
+        if not os.path.exists(source_path):
+            return False
+        versions = self.versions()
+        if not versions:
+            return True
+        built_from = self.manifest(versions[-1]).get('source', {})
+        return any(built_from.get(key) != value for key, value in storage.source_fingerprint(source_path).items())
+
+    def _background(self, fn, *args):
+        with self.lock:
+            if self.busy:
+                return self.task
+            future = self.task = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='snapshot-builder', daemon=True).start()
+        return future
+
+    def _build_and_activate(self, source_path, n_clusters):
+        try:
+            return self.activate(self.build(source_path, n_clusters))
+        except Exception:
+            self.failed_source = storage.source_fingerprint(source_path) if os.path.exists(source_path) else None
+            raise
+
+    def refresh(self, source_path, n_clusters=DEFAULT_N_CLUSTERS):
+        """Собирает и подключает новую версию в фоновом потоке; возвращает Future"""
+        return self._background(self._build_and_activate, source_path, n_clusters)
+
+    def start(self, source_path, n_clusters=DEFAULT_N_CLUSTERS):
+        """Подключает версию из CURRENT; без неё собирает первую версию синхронно
+
+        Если исходный файл изменился, пока приложение было выключено,
+        пользователи сразу получают старую версию, а новая собирается в фоне.
+        """
+        version = self.pointer()
+        if version not in self.versions():
+            version = (self.versions() or [None])[-1]
+        if version is None:
+            self._build_and_activate(source_path, n_clusters)
+            return self
+        self.activate(version)
+        if self.is_stale(source_path):
+            self.refresh(source_path, n_clusters)
+        return self
+
+    def sync(self, source_path, n_clusters=DEFAULT_N_CLUSTERS):
+        """Подхватывает версию, выбранную другим процессом, и пересобирает данные при изменении файла
+
+        Рассчитан на вызов при каждом обращении: без изменений это stat
+        исходного файла и чтение CURRENT. Сборка, упавшая на этом же файле,
+        повторяется только после его следующего изменения.
+        """
+        if self.busy:
+            return self.task
+        with self.lock:
+            pointer = self.pointer()
+            switched = pointer is not None and pointer != self.version and pointer in self.versions()
+        if switched:
+            return self._background(self.activate, pointer)
+        if self.is_stale(source_path) and self.failed_source != storage.source_fingerprint(source_path):
+            return self.refresh(source_path, n_clusters)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Версии обработанных данных: сборка, откат, список')
+    parser.add_argument('command', choices=('list', 'build', 'rollback', 'activate', 'prune'))
+    parser.add_argument('version', nargs='?', help='Версия для activate, например v000003')
+    parser.add_argument('--source', default='base_doc.xlsx')
+    parser.add_argument('--root-dir', default=SNAPSHOTS_DIR)
+    parser.add_argument('--keep', type=int, default=3)
+    parser.add_argument('--n-clusters', type=int, default=DEFAULT_N_CLUSTERS)
+    parser.add_argument('--encoder', choices=BACKENDS, default=os.environ.get('FRIENDFINDER_ENCODER', 'torch'))
+    args = parser.parse_args()
+
+    manager = SnapshotManager(args.root_dir, keep=args.keep, encoder=make_encoder(args.encoder))
+    try:
+        if args.command == 'build':
+            print(manager.point_to(manager.build(args.source, args.n_clusters)))
+        elif args.command == 'rollback':
+            print(manager.point_to(manager.previous_version()))
+        elif args.command == 'activate':
+            print(manager.point_to(args.version))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.command == 'prune':
+        print('\n'.join(manager.apply_retention()))
+    elif args.command == 'list':
+        pointer = manager.pointer()
+        for version in manager.versions():
+            manifest = manager.manifest(version)
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created_at']))
+            marker = '*' if version == pointer else ' '
+            print(f"{marker} {version}  {created}  {manifest['stats'].get('total_profiles', 0)} анкет")
+
+
+if __name__ == '__main__':
+    main()
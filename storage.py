@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+PROFILES_FILE = 'profiles.parquet'
+EMBEDDINGS_FILE = 'embeddings.npy'
+MODELS_FILE = 'models.joblib'
+META_FILE = 'meta.json'
+CHANGES_FILE = 'changes.jsonl'
+
+_changes_lock = threading.Lock()
+
+
+def read_profiles(path):
+    """Читает исходную таблицу анкет: Excel, CSV или Parquet"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return pd.read_csv(path)
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def source_fingerprint(source_path):
+    stat = os.stat(source_path)
+    return {
+        'source': os.path.abspath(source_path),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime
+    }
+
+
+def save_processed(directory, df, embeddings, models, meta):
+    """Сохраняет таблицу в Parquet, эмбеддинги в .npy, модели через joblib
+
+    embeddings=None оставляет на месте уже записанный embeddings.npy.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def target(name):
+        return os.path.join(directory, name)
+
+    df.to_parquet(target(PROFILES_FILE) + '.tmp', index=True)
+    os.replace(target(PROFILES_FILE) + '.tmp', target(PROFILES_FILE))
+
+    if embeddings is not None:
+        with open(target(EMBEDDINGS_FILE) + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+        os.replace(target(EMBEDDINGS_FILE) + '.tmp', target(EMBEDDINGS_FILE))
+
+    import joblib
+
+    joblib.dump(models, target(MODELS_FILE) + '.tmp')
+    os.replace(target(MODELS_FILE) + '.tmp', target(MODELS_FILE))
+
+    meta = dict(meta, rows=len(df))
+    with open(target(META_FILE) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(target(META_FILE) + '.tmp', target(META_FILE))
+
+
+def load_meta(directory):
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(directory, source_path, **expected):
+    """Проверяет, что сохранённые данные построены из того же файла и с теми же параметрами"""
+    meta = load_meta(directory)
+    if meta is None or not os.path.exists(source_path):
+        return False
+    for name in (PROFILES_FILE, EMBEDDINGS_FILE, MODELS_FILE):
+        if not os.path.exists(os.path.join(directory, name)):
+            return False
+
+    current = dict(source_fingerprint(source_path), **expected)
+    return all(meta.get(key) == value for key, value in current.items())
+
+
+def load_profiles(directory, mmap_mode=None):
+    df = pd.read_parquet(os.path.join(directory, PROFILES_FILE))
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+    return df, embeddings
+
+
+def load_processed(directory, mmap_mode=None):
+    df, embeddings = load_profiles(directory, mmap_mode=mmap_mode)
+    import joblib
+
+    models = joblib.load(os.path.join(directory, MODELS_FILE))
+    return df, embeddings, models, load_meta(directory)
+
+
+def append_changes(directory, entries):
+    """Дописывает изменения анкет в журнал (по строке JSON на изменение) и сбрасывает его на диск
+
+    Номера seq продолжают последний номер в файле, поэтому в один журнал
+    могут писать несколько процессоров. Возвращает номер последней записи.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _changes_lock:
+        seq = max([0] + [entry['seq'] for entry in read_changes(directory)])
+        for entry in entries:
+            seq += 1
+            entry['seq'] = seq
+        lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+        with open(os.path.join(directory, CHANGES_FILE), 'a+b') as f:
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    lines = b'\n' + lines
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+    return seq
+
+
+def read_changes(directory):
+    """Записи журнала изменений; строка, недописанная при сбое, пропускается"""
+    path = os.path.join(directory, CHANGES_FILE)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def change_key(description):
+    """Ключ анкеты в журнале изменений — хэш текста, не зависящий от нумерации строк источника"""
+    return hashlib.sha1(str(description).encode('utf-8')).hexdigest()
@@ -0,0 +1,49 @@
+from normalization import CUSTOM_STOP_WORDS, NLTK_RUSSIAN_STOP_WORDS, STOP_WORDS, normalize, tokenize
+
+LEMMAS = {'девушки': 'девушка', 'книги': 'книга', 'котов': 'кот', 'ежа': 'ёж', 'пьём': 'пить'}
+
+
+def lemmatize(token):
+    return LEMMAS.get(token, token)
+
+
+def test_tokenize_drops_punctuation_and_lowercases():
+    assert tokenize('Привет, мир! Я — Алёна...') == ['привет', 'мир', 'я', 'алёна']
+
+
+def test_tokenize_splits_on_digits_and_latin():
+    assert tokenize('Ёлка2024года и C++/Python, 3D-печать') == ['ёлка', 'года', 'и', 'печать']
+
+
+def test_tokenize_whitespace_only():
+    assert tokenize(' \t\n ') == []
+
+
+def test_normalize_keeps_yo():
+    assert normalize('Ёжик в тумане', lemmatize) == 'ёжик тумане'
+
+
+def test_normalize_non_string():
+    assert normalize(None, lemmatize) == ''
+    assert normalize(42, lemmatize) == ''
+
+
+def test_normalize_length_filter_before_and_after_lemmatization():
+    assert normalize('Он и ты на юг', lemmatize) == ''
+    assert normalize('Видел ежа', lemmatize) == 'видел'
+
+
+def test_normalize_stop_words_before_and_after_lemmatization():
+    assert normalize('Между тем девушки читают книги', lemmatize) == 'читают книга'
+    assert normalize('Пьём чай, гладим котов', lemmatize) == 'пить чай гладим кот'
+
+
+def test_normalize_custom_stop_words_and_min_length():
+    assert normalize('читаю книги', lemmatize, stop_words=frozenset({'книга'})) == 'читаю'
+    assert normalize('кот ест', lemmatize, min_length=4) == ''
+
+
+def test_bundled_stop_words():
+    assert len(NLTK_RUSSIAN_STOP_WORDS) == 151
+    assert STOP_WORDS == NLTK_RUSSIAN_STOP_WORDS | CUSTOM_STOP_WORDS
+    assert isinstance(STOP_WORDS, frozenset)
@@ -0,0 +1,97 @@
+import time
+import threading
+from concurrent.futures import Future
+
+
+class BackgroundLoader:
+    """Загружает тяжёлые ресурсы в фоновом потоке
+
+    Состояния: idle → loading → ready или failed. Задачи, переданные в
+    submit() до готовности, ставятся в очередь и выполняются по порядку
+    сразу после загрузки; после готовности выполняются в вызывающем потоке.
+    """
+
+    def __init__(self, load_fn, status_fn=None):
+        self.load_fn = load_fn
+        self.status_fn = status_fn
+        self.state = 'idle'
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self.pending = []
+        self.lock = threading.Lock()
+        self.ready_event = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.state != 'idle':
+                return self
+            self.state = 'loading'
+            self.started_at = time.perf_counter()
+        threading.Thread(target=self._load, name='background-loader', daemon=True).start()
+        return self
+
+    def _load(self):
+        try:
+            result = self.load_fn()
+        except Exception as e:
+            with self.lock:
+                self.state = 'failed'
+                self.error = e
+                pending, self.pending = self.pending, []
+            for future, _, _, _ in pending:
+                future.set_exception(e)
+        else:
+            with self.lock:
+                self.result = result
+                self.state = 'ready'
+                self.ready_at = time.perf_counter()
+                pending, self.pending = self.pending, []
+            for future, fn, args, kwargs in pending:
+                self._run(future, fn, args, kwargs)
+        finally:
+            self.ready_event.set()
+
+    def _run(self, future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.state == 'failed':
+                future.set_exception(self.error)
+                return future
+            if self.state != 'ready':
+                self.pending.append((future, fn, args, kwargs))
+                return future
+        self._run(future, fn, args, kwargs)
+        return future
+
+    def wait(self, timeout=None):
+        return self.ready_event.wait(timeout)
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    @property
+    def status(self):
+        if self.status_fn is not None and self.state == 'loading':
+            return self.status_fn()
+        return self.state
+
+    @property
+    def queued(self):
+        return len(self.pending)
+
+    @property
+    def time_to_ready(self):
+        if self.ready_at is None or self.started_at is None:
+            return None
+        return self.ready_at - self.started_at